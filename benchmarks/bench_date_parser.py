@@ -0,0 +1,128 @@
+"""
+Correctness corpus and latency for the natural-language reminder date parser.
+
+    python -m benchmarks.bench_date_parser [--iterations 20000]
+
+Every phrase is checked against its expected result for a fixed "now"
+(Wednesday 2026-10-14 10:30); the run exits non-zero on any mismatch. Then
+each phrase is timed cold (cache cleared) and warm (same phrase, same minute).
+Time-zone cases assume the server runs in UTC and are skipped otherwise.
+"""
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime
+
+from bot.date_parser import _parse, parse_when
+
+NOW = datetime(2026, 10, 14, 10, 30)
+
+# (phrase, expected due date, expected RRULE body)
+CORPUS = [
+    # Phrases the reminder tool has always documented
+    ("today at 3pm", datetime(2026, 10, 14, 15, 0), None),
+    ("today at 9am", datetime(2026, 10, 15, 9, 0), None),  # already passed -> tomorrow
+    ("today", datetime(2026, 10, 14, 10, 30), None),
+    ("", datetime(2026, 10, 14, 10, 30), None),
+    ("at 3pm", datetime(2026, 10, 14, 15, 0), None),
+    ("at 10:30", datetime(2026, 10, 15, 10, 30), None),
+    ("tomorrow", datetime(2026, 10, 15, 9, 0), None),
+    ("tomorrow at 12", datetime(2026, 10, 15, 12, 0), None),
+    ("tomorrow at 7:45 am", datetime(2026, 10, 15, 7, 45), None),
+    ("tomorrow at 12am", datetime(2026, 10, 15, 0, 0), None),
+    ("Tomorrow  at 3PM", datetime(2026, 10, 15, 15, 0), None),
+    ("in 2 hours", datetime(2026, 10, 14, 12, 30), None),
+    ("in 30 minutes", datetime(2026, 10, 14, 11, 0), None),
+    ("in an hour", datetime(2026, 10, 14, 11, 30), None),
+    ("in 3 days", datetime(2026, 10, 17, 10, 30), None),
+    ("in 3 days at 8pm", datetime(2026, 10, 17, 20, 0), None),
+    ("in 2 weeks", datetime(2026, 10, 28, 10, 30), None),
+    ("in 1 week at 9am", datetime(2026, 10, 21, 9, 0), None),
+    ("monday", datetime(2026, 10, 19, 9, 0), None),
+    ("tuesday at 18:30", datetime(2026, 10, 20, 18, 30), None),
+    ("wednesday", datetime(2026, 10, 21, 9, 0), None),  # today's weekday -> next week
+    ("friday", datetime(2026, 10, 16, 9, 0), None),
+    ("sat", datetime(2026, 10, 17, 9, 0), None),
+    ("thurs at 4:15pm", datetime(2026, 10, 15, 16, 15), None),
+    ("next friday", datetime(2026, 10, 23, 9, 0), None),
+    ("next wednesday at 5pm", datetime(2026, 10, 28, 17, 0), None),
+    ("next week", datetime(2026, 10, 21, 10, 30), None),
+    ("next week at 9am", datetime(2026, 10, 21, 9, 0), None),
+    # Used to be read as "next monday" because "mon" matched inside "month"
+    ("next month", datetime(2026, 11, 14, 10, 30), None),
+    ("next month at 8am", datetime(2026, 11, 14, 8, 0), None),
+    # Explicit dates (day-only dates default to 9am, like weekdays)
+    ("oct 20", datetime(2026, 10, 20, 9, 0), None),
+    ("october 20 at 5pm", datetime(2026, 10, 20, 17, 0), None),
+    ("3rd of march", datetime(2027, 3, 3, 9, 0), None),
+    ("2026-12-01", datetime(2026, 12, 1, 9, 0), None),
+    ("2026-12-01 at 14:00", datetime(2026, 12, 1, 14, 0), None),
+    ("tomorrow at noon", datetime(2026, 10, 15, 12, 0), None),
+    ("friday 6pm", datetime(2026, 10, 16, 18, 0), None),
+    ("no idea when", datetime(2026, 10, 14, 11, 30), None),  # unparseable -> in an hour
+    # Recurrence
+    ("every day at 8am", datetime(2026, 10, 15, 8, 0), "FREQ=DAILY"),
+    ("daily", datetime(2026, 10, 15, 9, 0), "FREQ=DAILY"),
+    ("every monday at 9am", datetime(2026, 10, 19, 9, 0), "FREQ=WEEKLY;BYDAY=MO"),
+    ("every mon and thu at 6pm", datetime(2026, 10, 15, 18, 0), "FREQ=WEEKLY;BYDAY=MO,TH"),
+    ("every weekday at 7:30", datetime(2026, 10, 15, 7, 30), "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR"),
+    ("every weekend at 10am", datetime(2026, 10, 17, 10, 0), "FREQ=WEEKLY;BYDAY=SA,SU"),
+    ("weekly on friday", datetime(2026, 10, 16, 9, 0), "FREQ=WEEKLY;BYDAY=FR"),
+    ("every other week", datetime(2026, 10, 28, 9, 0), "FREQ=WEEKLY;INTERVAL=2"),
+    ("every 2 hours", datetime(2026, 10, 14, 12, 30), "FREQ=HOURLY;INTERVAL=2"),
+    ("every month at 8pm", datetime(2026, 10, 14, 20, 0), "FREQ=MONTHLY"),
+    ("every year on oct 20", datetime(2026, 10, 20, 9, 0), "FREQ=YEARLY;BYMONTH=10;BYMONTHDAY=20"),
+    # A zero interval would never produce an occurrence: read as a one-off, an hour from now
+    ("every 0 days", datetime(2026, 10, 14, 11, 30), None),
+]
+
+# Only meaningful when server-local time is UTC
+TZ_CORPUS = [
+    ("tomorrow at 9am PST", datetime(2026, 10, 15, 16, 0), None),
+    ("at 9am Europe/Berlin", datetime(2026, 10, 15, 7, 0), None),
+    ("every day at 8am utc", datetime(2026, 10, 15, 8, 0), "FREQ=DAILY"),
+]
+
+
+def check(corpus) -> int:
+    failures = 0
+    for phrase, expected, expected_rule in corpus:
+        got, rule = parse_when(phrase, now=NOW)
+        if (got, rule) != (expected, expected_rule):
+            failures += 1
+            print(f"FAIL {phrase!r}: got {got} {rule}, expected {expected} {expected_rule}")
+    return failures
+
+
+def time_per_call(phrase: str, iterations: int, cold: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if cold:
+            _parse.cache_clear()
+        parse_when(phrase, now=NOW)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = list(CORPUS)
+    if time.localtime().tm_gmtoff == 0:
+        corpus += TZ_CORPUS
+    else:
+        print("Server time is not UTC, skipping time-zone cases")
+    failures = check(corpus)
+    print(f"Correctness: {len(corpus) - failures}/{len(corpus)} phrases")
+
+    cold = [time_per_call(p, max(args.iterations // 20, 1), cold=True) for p, _, _ in corpus]
+    warm = [time_per_call(p, args.iterations, cold=False) for p, _, _ in corpus]
+    print(f"Cold parse: median {statistics.median(cold):.1f}us, max {max(cold):.1f}us")
+    print(f"Cached:     median {statistics.median(warm):.2f}us, max {max(warm):.2f}us")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Filtered-search latency as the journal collection grows, with and without payload indexes.
+
+Needs a running Qdrant server (payload indexes have no effect in embedded mode):
+
+    python -m benchmarks.bench_filtered_search --sizes 10000,100000,1000000
+
+Uses random vectors, so no embedding model is loaded. Writes to a throwaway
+collection that is dropped at the end.
+"""
+import argparse
+import statistics
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from bot.embeddings import EMBEDDING_DIM
+from bot.vector_store import PAYLOAD_INDEXES
+
+COLLECTION = "bench_journal"
+VECTOR_NAME = "fast-bge-small-en-v1.5"
+TYPES = ["general", "goal", "idea", "fitness", "project"]
+
+
+def fill(client, start: int, stop: int, users: int, rng):
+    """Upload points [start, stop) with journal-shaped payloads"""
+    base = datetime(2024, 1, 1)
+    batch = 1000
+    for offset in range(start, stop, batch):
+        n = min(batch, stop - offset)
+        vectors = rng.standard_normal((n, EMBEDDING_DIM), dtype=np.float32)
+        payloads = [
+            {
+                "user_id": int(rng.integers(users)),
+                "type": TYPES[int(rng.integers(len(TYPES)))],
+                "timestamp": (base + timedelta(minutes=offset + i)).isoformat(),
+            }
+            for i in range(n)
+        ]
+        client.upsert(
+            collection_name=COLLECTION,
+            points=models.Batch(
+                ids=list(range(offset, offset + n)),
+                vectors={VECTOR_NAME: vectors.tolist()},
+                payloads=payloads,
+            ),
+            wait=True,
+        )
+
+
+def measure(client, users: int, queries: int, rng) -> dict:
+    """Run filtered searches for random users and return latency percentiles in ms"""
+    timings = []
+    for _ in range(queries):
+        vector = rng.standard_normal(EMBEDDING_DIM, dtype=np.float32).tolist()
+        user_filter = models.Filter(must=[
+            models.FieldCondition(key="user_id", match=models.MatchValue(value=int(rng.integers(users))))
+        ])
+        start = time.perf_counter()
+        client.search(
+            collection_name=COLLECTION,
+            query_vector=models.NamedVector(name=VECTOR_NAME, vector=vector),
+            query_filter=user_filter,
+            limit=5,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=6333)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated collection sizes")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    client = QdrantClient(host=args.host, port=args.port)
+    rng = np.random.default_rng(42)
+    sizes = sorted(int(s) for s in args.sizes.split(","))
+
+    print(f"{'points':>10} {'index':>6} {'p50 ms':>8} {'p95 ms':>8}")
+    for size in sizes:
+        if client.collection_exists(COLLECTION):
+            client.delete_collection(COLLECTION)
+        client.create_collection(
+            collection_name=COLLECTION,
+            vectors_config={VECTOR_NAME: models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE)},
+        )
+        fill(client, 0, size, args.users, rng)
+
+        result = measure(client, args.users, args.queries, rng)
+        print(f"{size:>10} {'no':>6} {result['p50']:>8.2f} {result['p95']:>8.2f}")
+
+        for field_name, schema in PAYLOAD_INDEXES["journal"].items():
+            client.create_payload_index(COLLECTION, field_name=field_name, field_schema=schema, wait=True)
+
+        result = measure(client, args.users, args.queries, rng)
+        print(f"{size:>10} {'yes':>6} {result['p50']:>8.2f} {result['p95']:>8.2f}")
+
+    client.delete_collection(COLLECTION)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import numpy as np
+from .config import AUDIO_PREPROCESS
+
+logger = logging.getLogger(__name__)
+
+# Opus always decodes at 48 kHz; Whisper models work at 16 kHz
+DECODE_RATE = 48000
+TARGET_RATE = 16000
+
+FRAME_SECONDS = 0.03
+# Frames quieter than this (dBFS) are never speech
+SILENCE_FLOOR_DB = -50.0
+# Speech is this far above the note's own noise floor (10th percentile frame energy)
+SPEECH_MARGIN_DB = 12.0
+# Silence kept around speech at the edges, and the longest pause kept inside the note
+EDGE_PAD_SECONDS = 0.2
+MAX_PAUSE_SECONDS = 0.5
+
+# Set once ffmpeg turns out to be missing, so we warn a single time
+_ffmpeg_missing = False
+
+
+def opus_channel_count(data: bytes) -> int:
+    """Channel count from the OpusHead packet of an Ogg/Opus stream (1 if not found)"""
+    idx = data.find(b"OpusHead", 0, 4096)
+    if idx < 0 or idx + 9 >= len(data):
+        return 1
+    return data[idx + 9] or 1
+
+
+async def _run_ffmpeg(args: list, data: bytes) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    out, err = await process.communicate(data)
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {err.decode(errors='replace').strip()}")
+    return out
+
+
+async def decode_opus(data: bytes):
+    """Decode Ogg/Opus bytes to float32 samples of shape (frames, channels) at 48 kHz, via pipes"""
+    channels = opus_channel_count(data)
+    pcm = await _run_ffmpeg(
+        ["-i", "pipe:0", "-f", "f32le", "-acodec", "pcm_f32le", "-ar", str(DECODE_RATE), "-ac", str(channels), "pipe:1"],
+        data
+    )
+    samples = np.frombuffer(pcm, dtype=np.float32)
+    return samples[: len(samples) - len(samples) % channels].reshape(-1, channels)
+
+
+async def encode_opus(samples: np.ndarray, rate: int = TARGET_RATE) -> bytes:
+    """Encode mono float32 samples to Ogg/Opus bytes, via pipes"""
+    return await _run_ffmpeg(
+        ["-f", "f32le", "-ar", str(rate), "-ac", "1", "-i", "pipe:0", "-c:a", "libopus", "-b:a", "24k", "-f", "ogg", "pipe:1"],
+        samples.astype(np.float32).tobytes()
+    )
+
+
+def downmix(samples: np.ndarray) -> np.ndarray:
+    """(frames, channels) -> mono"""
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+def resample(samples: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """Resample mono audio; integer downsampling ratios get an anti-aliasing FIR"""
+    if src_rate == dst_rate or len(samples) == 0:
+        return samples
+    if src_rate % dst_rate == 0:
+        factor = src_rate // dst_rate
+        # Windowed-sinc low-pass just below the new Nyquist frequency
+        taps = 16 * factor + 1
+        n = np.arange(taps) - (taps - 1) / 2
+        cutoff = 0.9 / factor
+        kernel = cutoff * np.sinc(cutoff * n) * np.hamming(taps)
+        kernel /= kernel.sum()
+        return np.convolve(samples, kernel, mode="same")[::factor].astype(np.float32)
+    duration = len(samples) / src_rate
+    src_t = np.linspace(0, duration, len(samples), endpoint=False)
+    dst_t = np.arange(int(duration * dst_rate)) / dst_rate
+    return np.interp(dst_t, src_t, samples).astype(np.float32)
+
+
+def trim_silence(samples: np.ndarray, rate: int) -> np.ndarray:
+    """Energy VAD: drop leading/trailing silence and shorten long internal pauses"""
+    frame = int(rate * FRAME_SECONDS)
+    n_frames = len(samples) // frame
+    pad = int(EDGE_PAD_SECONDS / FRAME_SECONDS)
+    # Too short to hold any silence worth trimming (and shorter than the padding kernel)
+    if n_frames <= 2 * pad:
+        return samples
+
+    frames = samples[: n_frames * frame].reshape(n_frames, frame)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-12)
+    noise_floor = np.percentile(energy_db, 10)
+    # Only trust the noise floor when it is real silence: in a note with no pauses
+    # it is quiet speech, and the relative threshold would cut those words out
+    if noise_floor > SILENCE_FLOOR_DB:
+        threshold = SILENCE_FLOOR_DB
+    else:
+        threshold = max(SILENCE_FLOOR_DB, noise_floor + SPEECH_MARGIN_DB)
+    speech = energy_db > threshold
+    if not speech.any():
+        return samples
+
+    # Grow speech regions by the edge padding so word onsets/tails survive
+    keep = np.convolve(speech, np.ones(2 * pad + 1, dtype=bool), mode="same") > 0
+
+    # Inside the note, keep at most MAX_PAUSE_SECONDS of each remaining silent run
+    first, last = np.flatnonzero(keep)[[0, -1]]
+    keep[:first] = False
+    keep[last + 1:] = False
+    max_pause = int(MAX_PAUSE_SECONDS / FRAME_SECONDS)
+    edges = np.diff(np.concatenate(([1], keep[first:last + 1].astype(np.int8), [1])))
+    for start, end in zip(np.flatnonzero(edges == -1), np.flatnonzero(edges == 1)):
+        if end - start > max_pause:
+            keep[first + start + max_pause: first + end] = False
+
+    return frames[keep].reshape(-1)
+
+
+def _prepare(decoded: np.ndarray) -> np.ndarray:
+    mono = downmix(decoded)
+    return trim_silence(resample(mono, DECODE_RATE, TARGET_RATE), TARGET_RATE)
+
+
+async def preprocess_voice(data: bytes) -> bytes:
+    """Trim silence, downmix to mono and resample a voice note to 16 kHz, all in memory.
+
+    Returns Ogg/Opus bytes ready for transcription, or the input unchanged if
+    preprocessing is disabled or fails for any reason.
+    """
+    global _ffmpeg_missing
+    if not AUDIO_PREPROCESS or _ffmpeg_missing:
+        return data
+    try:
+        decoded = await decode_opus(data)
+        prepared = await asyncio.to_thread(_prepare, decoded)
+        encoded = await encode_opus(prepared)
+    except FileNotFoundError:
+        _ffmpeg_missing = True
+        logger.warning("ffmpeg not found, sending voice notes to transcription unprocessed")
+        return data
+    except Exception as e:
+        # Preprocessing only helps; never let it cost the user their note
+        logger.warning(f"Audio preprocessing skipped: {e}")
+        return data
+
+    original_seconds = len(decoded) / DECODE_RATE
+    kept_seconds = len(prepared) / TARGET_RATE
+    logger.info(
+        f"Preprocessed voice note: {original_seconds:.1f}s -> {kept_seconds:.1f}s "
+        f"({original_seconds - kept_seconds:.1f}s silence removed), "
+        f"{len(data) / 1024:.0f} KB -> {len(encoded) / 1024:.0f} KB"
+    )
+    return encoded
@@ -0,0 +1,83 @@
+import re
+from dataclasses import dataclass
+from typing import List
+import numpy as np
+from .config import CATEGORIES
+
+# Below this confidence the caller may ask the LLM classifier instead
+LOW_CONFIDENCE = 0.6
+# Nearest-centroid matches: minimum cosine similarity, and how close to the best
+# score a runner-up has to be to be tagged as well
+CENTROID_MIN_SIMILARITY = 0.55
+CENTROID_MARGIN = 0.03
+
+
+@dataclass
+class CategoryResult:
+    categories: List[str]
+    confidence: float
+    source: str
+
+
+class Categorizer:
+    """Local categorization over the CATEGORIES keyword table.
+
+    A single compiled, word-bounded regex tags entries in microseconds; entries
+    with no keyword hit fall back to the nearest category centroid in bge
+    embedding space (entry embeddings are usually already cached by the write).
+    """
+
+    def __init__(self, categories: dict = CATEGORIES, get_embedder=None):
+        self.categories = categories
+        self._get_embedder = get_embedder
+        self._centroids = None
+
+        self._keyword_category = {}
+        for category, keywords in categories.items():
+            for keyword in keywords:
+                self._keyword_category.setdefault(keyword.lower(), category)
+        # Longest keywords first so "want to" wins over shorter overlaps
+        alternation = "|".join(
+            re.escape(k) for k in sorted(self._keyword_category, key=len, reverse=True)
+        )
+        self._pattern = re.compile(rf"\b(?:{alternation})\b", re.IGNORECASE)
+
+    def match_keywords(self, text: str) -> dict:
+        """Keyword hits per category"""
+        hits = {}
+        for match in self._pattern.finditer(text):
+            category = self._keyword_category[match.group(0).lower()]
+            hits[category] = hits.get(category, 0) + 1
+        return hits
+
+    async def _centroid_vectors(self, embedder) -> tuple:
+        if self._centroids is None:
+            names = list(self.categories)
+            rows = []
+            for name in names:
+                vectors = np.array(await embedder.embed_passages(self.categories[name]))
+                centroid = vectors.mean(axis=0)
+                rows.append(centroid / np.linalg.norm(centroid))
+            self._centroids = (names, np.stack(rows))
+        return self._centroids
+
+    async def categorize(self, text: str) -> CategoryResult:
+        hits = self.match_keywords(text)
+        if hits:
+            ranked = sorted(hits, key=hits.get, reverse=True)
+            # One hit is a decent signal, two or more is a strong one
+            confidence = min(1.0, 0.5 + 0.25 * sum(hits.values()))
+            return CategoryResult(ranked, confidence, "keywords")
+
+        if self._get_embedder is None:
+            return CategoryResult([], 0.0, "none")
+
+        embedder = self._get_embedder()
+        names, centroids = await self._centroid_vectors(embedder)
+        vector = np.array(await embedder.embed_passage(text))
+        scores = centroids @ (vector / np.linalg.norm(vector))
+        best = float(scores.max())
+        if best < CENTROID_MIN_SIMILARITY:
+            return CategoryResult([], best, "centroid")
+        chosen = [names[i] for i in np.argsort(-scores) if scores[i] >= best - CENTROID_MARGIN]
+        return CategoryResult(chosen, best, "centroid")
@@ -1,11 +1,12 @@
 import os
-import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 # Path for persistent settings
 DATA_DIR = "data"
+SETTINGS_DB_PATH = os.getenv("SETTINGS_DB_PATH", os.path.join(DATA_DIR, "settings.sqlite"))
+# Pre-SQLite global settings file, imported once on first start
 SETTINGS_FILE = os.path.join(DATA_DIR, "settings.json")
 
 if not os.path.exists(DATA_DIR):
@@ -15,42 +16,72 @@ DEFAULT_SETTINGS = {
     "llm_provider": os.getenv("LLM_PROVIDER", "deepseek"),
     "temperature": 0.7,
     "max_tokens": 500,
+    # "tools": the agent looks things up itself; "prefetch": context is retrieved up front
+    "retrieval_mode": os.getenv("RETRIEVAL_MODE", "tools"),
     "system_prompt": "You are a down-to-earth coach, mentor, friend, and personal assistant. Write short, casual messages as if texting a friend. NO bolding (**). NO complex formatting. Be concise and practical. When retrieving info, condense it to the essentials unless a full plan is requested."
 }
 
-def load_settings():
-    if os.path.exists(SETTINGS_FILE):
-        try:
-            with open(SETTINGS_FILE, "r") as f:
-                settings = json.load(f)
-                # Merge with defaults for new keys
-                for k, v in DEFAULT_SETTINGS.items():
-                    if k not in settings:
-                        settings[k] = v
-                return settings
-        except Exception:
-            return DEFAULT_SETTINGS.copy()
-    return DEFAULT_SETTINGS.copy()
-
-def save_settings(settings):
-    with open(SETTINGS_FILE, "w") as f:
-        json.dump(settings, f, indent=4)
-
-# Load current settings
-_current_settings = load_settings()
-
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# Shared HTTP pool per LLM provider (keep-alive, HTTP/2 when h2 is installed)
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_KEEPALIVE_SECONDS = float(os.getenv("HTTP_KEEPALIVE_SECONDS", "120"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
 QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
 QDRANT_PORT = int(os.getenv("QDRANT_PORT", "6333"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "2"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+# Optional SQLite file for embeddings that survive restarts, e.g. data/embeddings.sqlite
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH")
+# Rows kept on disk (~1.5 KB each); least recently used rows are evicted past this
+EMBEDDING_DISK_CACHE_SIZE = int(os.getenv("EMBEDDING_DISK_CACHE_SIZE", "20000"))
+
+# Transcription: "openai" (whisper-1 API) or "local" (faster-whisper, CPU int8)
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "openai")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", str(os.cpu_count() or 1)))
+TRANSCRIPTION_MAX_PENDING = int(os.getenv("TRANSCRIPTION_MAX_PENDING", "32"))
+# Trim silence and resample voice notes before transcription (needs ffmpeg on PATH)
+AUDIO_PREPROCESS = os.getenv("AUDIO_PREPROCESS", "true").lower() in ("1", "true", "yes")
+
+# Stream agent replies into the placeholder message instead of waiting for the full answer.
+# Off by default: with pydantic-ai 0.0.18 a response that starts with text ends the run,
+# so tool calls after it ("Got it, saving that!" + add_journal_entry) are dropped.
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+# Telegram throttles edits of one message at roughly one per second
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.0"))
+
+# Per-user conversation memory passed to the agent as message history
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "3000"))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "1000"))
+CONVERSATION_TTL_MINUTES = int(os.getenv("CONVERSATION_TTL_MINUTES", "180"))
+CONVERSATION_MAX_SNIPPETS = int(os.getenv("CONVERSATION_MAX_SNIPPETS", "20"))
+# Optional JSON file so conversations survive restarts, e.g. data/conversations.json
+CONVERSATION_CACHE_PATH = os.getenv("CONVERSATION_CACHE_PATH")
+
+# Confirm partial reminder matches ("done with X") by embedding similarity before completing them
+REMINDER_MATCH_CONFIRM = os.getenv("REMINDER_MATCH_CONFIRM", "true").lower() in ("1", "true", "yes")
+
+# Token budget for context injected into the system prompt in "prefetch" retrieval mode
+RETRIEVAL_TOKEN_BUDGET = int(os.getenv("RETRIEVAL_TOKEN_BUDGET", "800"))
+
+_settings_store = None
+
+def get_settings_store():
+    global _settings_store
+    if _settings_store is None:
+        from .settings_store import SettingsStore
+        _settings_store = SettingsStore(SETTINGS_DB_PATH, DEFAULT_SETTINGS, legacy_json=SETTINGS_FILE)
+    return _settings_store
 
-def get_setting(key):
-    return _current_settings.get(key, DEFAULT_SETTINGS.get(key))
+def get_setting(user_id, key):
+    """The user's value, else the global one, else the default"""
+    return (_settings_store or get_settings_store()).get(user_id, key)
 
-def update_setting(key, value):
-    _current_settings[key] = value
-    save_settings(_current_settings)
+def update_setting(user_id, key, value):
+    """Change one user's setting; persisted in the background"""
+    (_settings_store or get_settings_store()).set(user_id, key, value)
 
 CATEGORIES = {
     "fitness": ["workout", "gym", "exercise", "training", "run", "fitness", "cardio", "strength"],
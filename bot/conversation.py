@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, replace
+from typing import List, Optional
+from pydantic_ai.messages import ModelMessage, ModelMessagesTypeAdapter, ModelRequest, SystemPromptPart
+from .config import (
+    CONVERSATION_MAX_USERS,
+    CONVERSATION_TOKEN_BUDGET,
+    CONVERSATION_TTL_MINUTES,
+    CONVERSATION_MAX_SNIPPETS,
+    CONVERSATION_CACHE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(messages: List[ModelMessage]) -> int:
+    """Rough token count (about 4 characters per token for English JSON/text)"""
+    return len(ModelMessagesTypeAdapter.dump_json(messages)) // 4
+
+
+@dataclass
+class Conversation:
+    # Each turn is (messages, estimated tokens); a turn starts with a user prompt
+    turns: deque = field(default_factory=deque)
+    tokens: int = 0
+    # System prompt parts from the latest run, spliced back in front of the history
+    system_parts: list = field(default_factory=list)
+    snippets: deque = field(default_factory=lambda: deque(maxlen=CONVERSATION_MAX_SNIPPETS))
+    updated_at: float = field(default_factory=time.time)
+
+
+class ConversationCache:
+    """Per-user message history and recently retrieved journal snippets.
+
+    Histories are trimmed from the oldest turn to fit a token budget, idle
+    conversations expire after a TTL, and the least recently active user is
+    evicted once more than max_users are held. Optionally saved to a JSON file.
+    """
+
+    def __init__(
+        self,
+        max_users: int = CONVERSATION_MAX_USERS,
+        token_budget: int = CONVERSATION_TOKEN_BUDGET,
+        ttl_seconds: float = CONVERSATION_TTL_MINUTES * 60,
+        path: Optional[str] = CONVERSATION_CACHE_PATH
+    ):
+        self.max_users = max_users
+        self.token_budget = token_budget
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._conversations = OrderedDict()
+        self.evictions = 0
+
+    def _get(self, user_id: int, create: bool = False) -> Optional[Conversation]:
+        conversation = self._conversations.get(user_id)
+        if conversation is not None and time.time() - conversation.updated_at > self.ttl_seconds:
+            # Stale context hurts more than it helps: start over
+            del self._conversations[user_id]
+            conversation = None
+        if conversation is None and create:
+            conversation = Conversation()
+            self._conversations[user_id] = conversation
+            while len(self._conversations) > self.max_users:
+                self._conversations.popitem(last=False)
+                self.evictions += 1
+        if conversation is not None:
+            self._conversations.move_to_end(user_id)
+        return conversation
+
+    def history(self, user_id: int) -> List[ModelMessage]:
+        """Message history for the next run, with the system prompt in front"""
+        conversation = self._get(user_id)
+        if conversation is None or not conversation.turns:
+            return []
+        messages = [m for turn, _ in conversation.turns for m in turn]
+        first = messages[0]
+        messages[0] = replace(first, parts=list(conversation.system_parts) + list(first.parts))
+        return messages
+
+    def append(self, user_id: int, new_messages: List[ModelMessage]):
+        """Store the messages of a finished run as one turn and trim to the budget"""
+        conversation = self._get(user_id, create=True)
+        turn = []
+        for message in new_messages:
+            if isinstance(message, ModelRequest):
+                system_parts = [p for p in message.parts if isinstance(p, SystemPromptPart)]
+                if system_parts:
+                    conversation.system_parts = system_parts
+                    message = replace(message, parts=[p for p in message.parts if not isinstance(p, SystemPromptPart)])
+            turn.append(message)
+        if not turn:
+            return
+
+        tokens = estimate_tokens(turn)
+        conversation.turns.append((turn, tokens))
+        conversation.tokens += tokens
+        conversation.updated_at = time.time()
+        # Drop whole turns, oldest first, but always keep the latest one
+        while conversation.tokens > self.token_budget and len(conversation.turns) > 1:
+            _, dropped = conversation.turns.popleft()
+            conversation.tokens -= dropped
+
+    def add_snippets(self, user_id: int, snippets: List[str]):
+        """Remember journal lines a tool retrieved, newest last, without duplicates"""
+        conversation = self._get(user_id, create=True)
+        for snippet in snippets:
+            if snippet in conversation.snippets:
+                conversation.snippets.remove(snippet)
+            conversation.snippets.append(snippet)
+
+    def snippets(self, user_id: int) -> List[str]:
+        conversation = self._get(user_id)
+        return list(conversation.snippets) if conversation else []
+
+    def clear(self, user_id: int):
+        self._conversations.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._conversations),
+            "tokens": sum(c.tokens for c in self._conversations.values()),
+            "evictions": self.evictions,
+        }
+
+    def save(self):
+        if not self.path:
+            return
+        data = {}
+        for user_id, conversation in self._conversations.items():
+            data[str(user_id)] = {
+                "turns": [ModelMessagesTypeAdapter.dump_python(turn, mode="json") for turn, _ in conversation.turns],
+                "system": ModelMessagesTypeAdapter.dump_python(
+                    [ModelRequest(parts=conversation.system_parts)], mode="json"
+                ),
+                "snippets": list(conversation.snippets),
+                "updated_at": conversation.updated_at,
+            }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+        logger.info(f"Saved {len(data)} conversations to {self.path}")
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+            for user_id, saved in data.items():
+                conversation = Conversation(updated_at=saved["updated_at"])
+                for raw_turn in saved["turns"]:
+                    turn = ModelMessagesTypeAdapter.validate_python(raw_turn)
+                    tokens = estimate_tokens(turn)
+                    conversation.turns.append((turn, tokens))
+                    conversation.tokens += tokens
+                conversation.system_parts = list(ModelMessagesTypeAdapter.validate_python(saved["system"])[0].parts)
+                conversation.snippets.extend(saved["snippets"])
+                self._conversations[int(user_id)] = conversation
+        except Exception as e:
+            logger.warning(f"Could not load conversations from {self.path}: {e}")
+            self._conversations.clear()
+            return
+        logger.info(f"Loaded {len(self._conversations)} conversations from {self.path}")
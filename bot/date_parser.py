@@ -0,0 +1,360 @@
+"""Natural-language reminder dates: "tomorrow at 3pm", "in 2 hours", "next friday",
+"every monday at 9am", optionally with a time zone ("at 9am PST", "Europe/Berlin").
+
+All patterns are compiled once at import. Results are cached per normalized phrase
+and minute, so repeated phrases cost a dict lookup.
+"""
+import re
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo, available_timezones
+from dateutil import parser as dateparser
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import rrulestr
+
+# Time used when a phrase names a day but no time
+DEFAULT_HOUR = 9
+PARSE_CACHE_SIZE = 4096
+
+WEEKDAYS = {
+    "monday": 0, "mon": 0,
+    "tuesday": 1, "tue": 1, "tues": 1,
+    "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3,
+    "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5,
+    "sunday": 6, "sun": 6,
+}
+RRULE_DAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+MONTHS = {
+    name: number
+    for number, names in enumerate(
+        [("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"), ("may",),
+         ("june", "jun"), ("july", "jul"), ("august", "aug"), ("september", "sep", "sept"),
+         ("october", "oct"), ("november", "nov"), ("december", "dec")],
+        start=1
+    )
+    for name in names
+}
+UNITS = {
+    "minute": "minutes", "min": "minutes", "hour": "hours", "hr": "hours",
+    "day": "days", "week": "weeks", "month": "months", "year": "years",
+}
+FREQUENCIES = {
+    "minute": "MINUTELY", "hour": "HOURLY", "day": "DAILY",
+    "week": "WEEKLY", "month": "MONTHLY", "year": "YEARLY",
+}
+# Common abbreviations; region zones so daylight saving time is handled
+TZ_ABBREVIATIONS = {
+    "utc": "UTC", "gmt": "UTC",
+    "est": "America/New_York", "edt": "America/New_York",
+    "cst": "America/Chicago", "cdt": "America/Chicago",
+    "mst": "America/Denver", "mdt": "America/Denver",
+    "pst": "America/Los_Angeles", "pdt": "America/Los_Angeles",
+    "bst": "Europe/London", "cet": "Europe/Paris", "cest": "Europe/Paris",
+    "ist": "Asia/Kolkata", "jst": "Asia/Tokyo", "aest": "Australia/Sydney",
+}
+
+_WEEKDAY = "|".join(sorted(WEEKDAYS, key=len, reverse=True))
+_MONTH = "|".join(sorted(MONTHS, key=len, reverse=True))
+_UNIT = "|".join(UNITS)
+
+_SPACES = re.compile(r"\s+")
+_TZ_ABBREVIATION = re.compile(rf"\b(?:{'|'.join(TZ_ABBREVIATIONS)})\b")
+_TZ_NAME = re.compile(r"\b[a-z]+/[a-z_]+(?:/[a-z_]+)?\b")
+_TIME_AT = re.compile(r"\bat\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b")
+_TIME_BARE = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b|\b(\d{1,2}):(\d{2})\b")
+_TIME_WORD = re.compile(r"\b(?:at\s+)?(noon|midnight)\b")
+
+_RELATIVE = re.compile(rf"\bin\s+(\d+|an?)\s+({_UNIT})s?\b")
+_TOMORROW = re.compile(r"\btomorrow\b")
+_TODAY = re.compile(r"\btoday\b")
+_WEEKDAY_NAME = re.compile(rf"\b(next\s+)?({_WEEKDAY})\b")
+_NEXT_PERIOD = re.compile(r"\bnext\s+(week|month)\b")
+_ISO_DATE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_MONTH_DAY = re.compile(rf"\b(?:({_MONTH})\s+(\d{{1,2}})(?:st|nd|rd|th)?|(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({_MONTH}))\b")
+
+_EVERY_UNIT = re.compile(rf"\bevery\s+(?:([1-9]\d*|other)\s+)?(minute|hour|day|week|month|year)s?\b")
+_EVERY_DAYS = re.compile(rf"\bevery\s+((?:{_WEEKDAY})(?:\s*(?:,|and|&)\s*(?:{_WEEKDAY}))*)\b")
+_EVERY_WEEKDAY = re.compile(r"\bevery\s+(weekday|weekend)s?\b")
+_ADVERB = re.compile(r"\b(hourly|daily|weekly|monthly|yearly|annually)\b")
+_DAY_LIST_SPLIT = re.compile(r"\s*(?:,|and|&)\s*")
+
+# Larger intervals ("every 100000 years") aren't reminders and can overflow dateutil
+MAX_RECURRENCE_INTERVAL = 366
+
+_ADVERB_FREQUENCIES = {
+    "hourly": "HOURLY", "daily": "DAILY", "weekly": "WEEKLY",
+    "monthly": "MONTHLY", "yearly": "YEARLY", "annually": "YEARLY",
+}
+
+
+def normalize(text: str) -> str:
+    return _SPACES.sub(" ", text.lower()).strip()
+
+
+@lru_cache(maxsize=1)
+def _zone_names() -> dict:
+    return {name.lower(): name for name in available_timezones()}
+
+
+def _find_zone(text: str) -> Tuple[Optional[str], str]:
+    """(IANA zone name or None, text without the zone)"""
+    match = _TZ_ABBREVIATION.search(text)
+    if match:
+        return TZ_ABBREVIATIONS[match.group(0)], _remove(text, match)
+    match = _TZ_NAME.search(text)
+    if match:
+        name = _zone_names().get(match.group(0))
+        if name:
+            return name, _remove(text, match)
+    return None, text
+
+
+def _remove(text: str, match) -> str:
+    return _SPACES.sub(" ", text[:match.start()] + " " + text[match.end():]).strip()
+
+
+def _clock(hour: int, minute: int, am_pm: Optional[str]) -> Tuple[int, int]:
+    if am_pm == "pm" and hour < 12:
+        hour += 12
+    elif am_pm == "am" and hour == 12:
+        hour = 0
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Invalid time {hour}:{minute:02d}")
+    return hour, minute
+
+
+def _find_time(text: str) -> Tuple[Optional[Tuple[int, int]], str]:
+    """((hour, minute) or None, text without the time)"""
+    match = _TIME_AT.search(text)
+    if match:
+        return _clock(int(match.group(1)), int(match.group(2) or 0), match.group(3)), _remove(text, match)
+    match = _TIME_WORD.search(text)
+    if match:
+        return ((12, 0) if match.group(1) == "noon" else (0, 0)), _remove(text, match)
+    match = _TIME_BARE.search(text)
+    if match:
+        if match.group(1):
+            return _clock(int(match.group(1)), int(match.group(2) or 0), match.group(3)), _remove(text, match)
+        return _clock(int(match.group(4)), int(match.group(5)), None), _remove(text, match)
+    return None, text
+
+
+def _at(day: datetime, time: Optional[Tuple[int, int]], default_hour: Optional[int] = None) -> datetime:
+    if time:
+        return day.replace(hour=time[0], minute=time[1], second=0, microsecond=0)
+    if default_hour is not None:
+        return day.replace(hour=default_hour, minute=0, second=0, microsecond=0)
+    return day
+
+
+def _parse_relative(match, text, now, time):
+    amount = 1 if match.group(1) in ("a", "an") else int(match.group(1))
+    unit = UNITS[match.group(2)]
+    result = now + relativedelta(**{unit: amount})
+    # Sub-day offsets are exact; day-level ones honour an explicit time
+    return result if unit in ("minutes", "hours") else _at(result, time)
+
+
+def _parse_tomorrow(match, text, now, time):
+    return _at(now + timedelta(days=1), time, DEFAULT_HOUR)
+
+
+def _parse_today(match, text, now, time):
+    result = _at(now, time)
+    # A time that has already passed today means tomorrow
+    if time and result <= now:
+        result += timedelta(days=1)
+    return result
+
+
+def _parse_weekday(match, text, now, time):
+    days_ahead = WEEKDAYS[match.group(2)] - now.weekday()
+    # Today's or an earlier weekday means next week's
+    if days_ahead <= 0:
+        days_ahead += 7
+    # "next friday" skips the coming one
+    if match.group(1) or "next" in text:
+        days_ahead += 7
+    return _at(now + timedelta(days=days_ahead), time, DEFAULT_HOUR)
+
+
+def _parse_next_period(match, text, now, time):
+    period = relativedelta(weeks=1) if match.group(1) == "week" else relativedelta(months=1)
+    return _at(now + period, time)
+
+
+def _parse_iso_date(match, text, now, time):
+    day = datetime(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+    return _at(day, time, DEFAULT_HOUR)
+
+
+def _parse_month_day(match, text, now, time):
+    month = MONTHS[match.group(1) or match.group(4)]
+    day = int(match.group(2) or match.group(3))
+    result = _at(datetime(now.year, month, day), time, DEFAULT_HOUR)
+    # A date that has passed this year means next year's
+    if result <= now:
+        result = result.replace(year=now.year + 1)
+    return result
+
+
+# Tried in order; the first pattern that matches decides the date
+DATE_RULES = (
+    (_RELATIVE, _parse_relative),
+    (_TOMORROW, _parse_tomorrow),
+    (_TODAY, _parse_today),
+    (_WEEKDAY_NAME, _parse_weekday),
+    (_NEXT_PERIOD, _parse_next_period),
+    (_ISO_DATE, _parse_iso_date),
+    (_MONTH_DAY, _parse_month_day),
+)
+
+
+def _parse_local(text: str, now: datetime, time: Optional[Tuple[int, int]]) -> datetime:
+    if not text:
+        return _parse_today(None, text, now, time)
+    for pattern, handler in DATE_RULES:
+        match = pattern.search(text)
+        if match:
+            return handler(match, text, now, time)
+
+    # Anything else ("oct 3rd 2027", "3/10") goes to dateutil, which is far slower but rare
+    try:
+        parsed = dateparser.parse(text, fuzzy=True, default=now.replace(hour=0, minute=0, second=0, microsecond=0))
+    except (ValueError, OverflowError):
+        parsed = None
+    parsed = _at(parsed, time) if parsed else None
+    # Unparseable, or only matched the default (today at midnight): an hour from now
+    if parsed is None or parsed <= now:
+        return now + timedelta(hours=1)
+    return parsed
+
+
+def _in_zone(now: datetime, zone: Optional[str]) -> datetime:
+    """Server-local naive now as naive wall-clock time in zone"""
+    if zone is None:
+        return now
+    return now.astimezone(ZoneInfo(zone)).replace(tzinfo=None)
+
+
+def _to_local(result: datetime, zone: Optional[str]) -> datetime:
+    """Naive wall-clock time in zone back to server-local naive, which is what due dates store"""
+    if zone is None:
+        return result
+    return result.replace(tzinfo=ZoneInfo(zone)).astimezone().replace(tzinfo=None)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(text: str, now: datetime, default_zone: Optional[str]) -> Tuple[datetime, Optional[str]]:
+    zone, text = _find_zone(text)
+    zone = zone or default_zone
+    rule, text = _find_recurrence(text)
+    time, text = _find_time(text)
+    if rule and rule.startswith("FREQ=WEEKLY") and "BYDAY" not in rule:
+        # "weekly on friday", "every week on mon"
+        day = _WEEKDAY_NAME.search(text)
+        if day:
+            rule += f";BYDAY={RRULE_DAYS[WEEKDAYS[day.group(2)]]}"
+    elif rule == "FREQ=YEARLY":
+        # "every year on oct 20", "annually on the 3rd of march"
+        date = _MONTH_DAY.search(text)
+        if date:
+            month = MONTHS[date.group(1) or date.group(4)]
+            rule += f";BYMONTH={month};BYMONTHDAY={int(date.group(2) or date.group(3))}"
+    local_now = _in_zone(now, zone)
+
+    if rule is None:
+        return _to_local(_parse_local(text, local_now, time), zone), None
+
+    # The series starts today at the given time (sub-day rules: now); the first
+    # reminder is its first occurrence still ahead of us
+    sub_day = rule.startswith(("FREQ=MINUTELY", "FREQ=HOURLY"))
+    start = local_now if sub_day else _at(local_now, time, DEFAULT_HOUR)
+    return _to_local(next_occurrence(rule, start, local_now), zone), rule
+
+
+def _find_recurrence(text: str) -> Tuple[Optional[str], str]:
+    """(RRULE body such as "FREQ=WEEKLY;BYDAY=MO" or None, text without the phrase)"""
+    match = _EVERY_WEEKDAY.search(text)
+    if match:
+        days = "MO,TU,WE,TH,FR" if match.group(1) == "weekday" else "SA,SU"
+        return f"FREQ=WEEKLY;BYDAY={days}", _remove(text, match)
+    match = _EVERY_DAYS.search(text)
+    if match:
+        days = sorted({WEEKDAYS[d] for d in _DAY_LIST_SPLIT.split(match.group(1)) if d})
+        return "FREQ=WEEKLY;BYDAY=" + ",".join(RRULE_DAYS[d] for d in days), _remove(text, match)
+    match = _EVERY_UNIT.search(text)
+    if match:
+        interval = 2 if match.group(1) == "other" else int(match.group(1) or 1)
+        if interval > MAX_RECURRENCE_INTERVAL:
+            raise ValueError(f"Can't repeat every {interval} {match.group(2)}s")
+        rule = f"FREQ={FREQUENCIES[match.group(2)]}"
+        return (rule if interval == 1 else f"{rule};INTERVAL={interval}"), _remove(text, match)
+    match = _ADVERB.search(text)
+    if match:
+        return f"FREQ={_ADVERB_FREQUENCIES[match.group(1)]}", _remove(text, match)
+    return None, text
+
+
+def next_occurrence(rule: str, start: datetime, after: datetime) -> datetime:
+    """First occurrence of an RRULE body (series starting at start) strictly after `after`.
+
+    Raises ValueError when the rule has no further occurrence.
+    """
+    occurrence = rrulestr(rule, dtstart=start).after(after)
+    if occurrence is None:
+        raise ValueError(f"No occurrence of {rule} after {after:%Y-%m-%d %H:%M}")
+    return occurrence
+
+
+def parse_when(text: str, now: datetime = None, tz: str = None) -> Tuple[datetime, Optional[str]]:
+    """Parse a reminder time. Returns (due datetime, RRULE body or None for one-off).
+
+    now defaults to the current time; results are computed against the current
+    minute and cached. tz is the zone to read wall-clock times in when the
+    phrase names none; the returned datetime is naive server-local time.
+    """
+    now = (now or datetime.now()).replace(second=0, microsecond=0)
+    return _parse(normalize(text), now, tz)
+
+
+def parse_natural_date(text: str, now: datetime = None, tz: str = None) -> datetime:
+    """
+    Parse natural language dates and times like:
+    - 'today at 3pm', 'tomorrow at 12', 'Tuesday at 18:30'
+    - 'in 2 hours', 'in 30 minutes'
+    - 'next week', 'in 3 days', 'oct 20', 'tomorrow at 9am PST'
+    Returns a naive local datetime
+    """
+    return parse_when(text, now, tz)[0]
+
+
+def parse_recurrence(text: str) -> Optional[str]:
+    """RRULE body for phrases like 'every monday', 'daily at 8', 'every 2 hours', else None"""
+    return _find_recurrence(normalize(text))[0]
+
+
+_DAY_NAMES = dict(zip(RRULE_DAYS, ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")))
+_UNIT_NAMES = {frequency: unit for unit, frequency in FREQUENCIES.items()}
+
+
+def describe_recurrence(rule: str) -> str:
+    """Human wording for an RRULE body: "every day", "every Monday and Thursday", "every 2 hours" """
+    parts = dict(part.split("=", 1) for part in rule.split(";"))
+    days = parts.get("BYDAY")
+    if days == "MO,TU,WE,TH,FR":
+        return "every weekday"
+    if days == "SA,SU":
+        return "every weekend"
+    if days:
+        names = [_DAY_NAMES[d] for d in days.split(",")]
+        return "every " + (" and ".join(names) if len(names) <= 2 else ", ".join(names[:-1]) + " and " + names[-1])
+    if "BYMONTH" in parts and "BYMONTHDAY" in parts:
+        month = datetime(2000, int(parts["BYMONTH"]), 1).strftime("%B")
+        return f"every year on {month} {int(parts['BYMONTHDAY'])}"
+    unit = _UNIT_NAMES.get(parts["FREQ"], "time")
+    interval = int(parts.get("INTERVAL", 1))
+    return f"every {unit}" if interval == 1 else f"every {interval} {unit}s"
@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import logging
+import resource
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+import numpy as np
+from .config import EMBEDDING_WORKERS, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH, EMBEDDING_DISK_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# FastEmbed model
+MODEL_NAME = "BAAI/bge-small-en-v1.5"  # 384 dim, fast and light
+EMBEDDING_DIM = 384
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of this process in MB"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class EmbeddingCache:
+    """Content-addressed LRU of embeddings, optionally backed by SQLite on disk.
+
+    Keys hash the model name and embedding kind ("passage"/"query") with
+    whitespace-normalized text. The disk store keeps at most `max_disk_rows`,
+    evicting the least recently used.
+    Vectors are kept as float32 arrays (~1.5 KB at 384 dims, vs ~12 KB as a list of floats).
+    Memory lookups happen on the event loop; disk lookups run on the embedder's workers.
+    """
+
+    def __init__(
+        self,
+        max_size: int = EMBEDDING_CACHE_SIZE,
+        path: Optional[str] = EMBEDDING_CACHE_PATH,
+        max_disk_rows: int = EMBEDDING_DISK_CACHE_SIZE
+    ):
+        self.max_size = max_size
+        self.max_disk_rows = max_disk_rows
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._db = None
+        self._db_lock = threading.Lock()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            columns = [row[1] for row in self._db.execute("PRAGMA table_info(embeddings)")]
+            if columns and "accessed_at" not in columns:
+                # Older store: keys lacked the model name, so its rows can't be reused
+                logger.info(f"Rebuilding embedding cache {path} for the new key format")
+                self._db.execute("DROP TABLE embeddings")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, accessed_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at)")
+            self._db.commit()
+
+    @staticmethod
+    def key(kind: str, text: str, model_name: str = MODEL_NAME) -> str:
+        normalized = " ".join(text.split())
+        return hashlib.sha1(f"{model_name}\0{kind}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return vector
+
+    def put(self, key: str, vector: np.ndarray):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def load_from_disk(self, keys: List[str]) -> dict:
+        """Look up keys in the disk store (call from a worker thread)"""
+        if self._db is None or not keys:
+            return {}
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()
+            if rows:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(now, key) for key, _ in rows])
+                self._db.commit()
+        return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+    def save_to_disk(self, items: dict):
+        """Persist new embeddings, evicting the least recently used past the row cap (call from a worker thread)"""
+        if self._db is None or not items:
+            return
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, accessed_at) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items.items()]
+            )
+            excess = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_disk_rows
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+
+class Embedder:
+    """Runs the FastEmbed model on a bounded worker pool so ONNX inference never blocks the event loop"""
+
+    def __init__(self, model_name: str = MODEL_NAME, workers: int = EMBEDDING_WORKERS, cache: EmbeddingCache = None):
+        self.model_name = model_name
+        self._model = None
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+        self.cache = cache or EmbeddingCache()
+
+    def _get_model(self):
+        if self._model is None:
+            from fastembed import TextEmbedding
+            start = time.perf_counter()
+            self._model = TextEmbedding(model_name=self.model_name)
+            logger.info(
+                f"Loaded embedding model {self.model_name} in {time.perf_counter() - start:.2f}s "
+                f"(peak RSS {peak_rss_mb():.0f} MB)"
+            )
+        return self._model
+
+    async def warmup(self):
+        """Load the model on the worker pool ahead of the first message"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._get_model)
+
+    def _embed_passages(self, texts: List[str]) -> List[np.ndarray]:
+        return [np.asarray(v, dtype=np.float32) for v in self._get_model().passage_embed(texts)]
+
+    def _embed_query(self, text: str) -> np.ndarray:
+        return np.asarray(next(iter(self._get_model().query_embed(text))), dtype=np.float32)
+
+    def _compute(self, kind: str, keys: List[str], texts: List[str]):
+        """Resolve cache misses from disk, then the model (runs on a worker).
+
+        Returns the vectors by key and how many came from disk.
+        """
+        found = self.cache.load_from_disk(keys)
+        disk_hits = len(found)
+        todo = [(key, text) for key, text in zip(keys, texts) if key not in found]
+        if todo:
+            if kind == "query":
+                vectors = [self._embed_query(text) for _, text in todo]
+            else:
+                vectors = self._embed_passages([text for _, text in todo])
+            computed = {key: vector for (key, _), vector in zip(todo, vectors)}
+            self.cache.save_to_disk(computed)
+            found.update(computed)
+        return found, disk_hits
+
+    async def _embed(self, kind: str, texts: List[str]) -> List[np.ndarray]:
+        keys = [EmbeddingCache.key(kind, text, self.model_name) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            vector = self.cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+            elif key not in missing:
+                missing[key] = text
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            computed, disk_hits = await loop.run_in_executor(
+                self._executor, self._compute, kind, list(missing), list(missing.values())
+            )
+            self.cache.disk_hits += disk_hits
+            self.cache.misses += len(missing) - disk_hits
+            for key, vector in computed.items():
+                self.cache.put(key, vector)
+            vectors.update(computed)
+
+        return [vectors[key] for key in keys]
+
+    async def embed_passages(self, texts: List[str], cache: bool = True) -> List[np.ndarray]:
+        """Embed documents for storage (float32 arrays; call .tolist() for Qdrant).
+
+        cache=False skips the memory and disk caches entirely, for bulk imports
+        whose texts won't be embedded again and would only evict useful entries.
+        """
+        if not cache:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._embed_passages, list(texts))
+        return await self._embed("passage", list(texts))
+
+    async def embed_passage(self, text: str) -> np.ndarray:
+        return (await self.embed_passages([text]))[0]
+
+    async def embed_query(self, text: str) -> np.ndarray:
+        """Embed a search query"""
+        return (await self._embed("query", [text]))[0]
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.cache.close()
@@ -1,20 +1,32 @@
-import os
+import io
 import json
+import logging
 import random
 import subprocess
+import time
 from datetime import datetime
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
-from .vector_store import VectorStore
+from .vector_store import get_vector_store
 from .llm_client import LLMClient, JournalDeps
-from .config import CATEGORIES, get_setting, update_setting
+from .transcription import TranscriptionBusy
+from .audio import preprocess_voice
+from .intent_router import IntentRouter, is_question
+from .reminder_index import ReminderIndex
+from .reminder_scheduler import create_reminder
+from .date_parser import describe_recurrence
+from .streaming import StreamEditor
+from .config import CATEGORIES, STREAM_RESPONSES, get_setting, update_setting
 
 load_dotenv()
 
-vector_store = VectorStore()
+logger = logging.getLogger(__name__)
+
 llm_client = LLMClient()
+intent_router = IntentRouter(lambda: get_vector_store().embedder)
+reminder_index = ReminderIndex(get_vector_store)
 
 FEEDBACK_PHRASES = [
     "Thinking...",
@@ -65,37 +77,43 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     status_msg = await update.message.reply_text(get_random_feedback())
     
     try:
-        os.makedirs("data", exist_ok=True)
+        # Voice notes stay in memory: no temp files to write, reopen or leak
         voice_file = await update.message.voice.get_file()
-        audio_path = f"data/{update.message.message_id}.ogg"
-        await voice_file.download_to_drive(audio_path)
-        
-        # Always use OpenAI Whisper API for light & fast transcription
+        audio = io.BytesIO()
+        await voice_file.download_to_memory(out=audio)
+
+        # Trimmed, mono, 16 kHz Opus: less audio to upload and transcribe
+        prepared = await preprocess_voice(audio.getvalue())
+
         try:
-            text = await llm_client.transcribe(audio_path)
+            text = await llm_client.transcribe(prepared, filename=f"{update.message.message_id}.ogg")
+        except TranscriptionBusy:
+            await status_msg.edit_text("Lots of voice notes coming in right now, try again in a minute.")
+            return
         except Exception as api_err:
-            await status_msg.edit_text("Transcription failed. Please check your OpenAI API key.")
+            await status_msg.edit_text("Transcription failed. Please check your transcription setup.")
             raise api_err
 
-        # Check if message mentions any reminders and auto-complete them
-        await check_and_complete_reminders(text, update.message.from_user.id)
+        # Reminders, completions, task lists and plain notes skip the agent
+        # A voice note is always saved, so completions are handled but still reach the agent
+        fast_reply, completed = await route_message(text, update.message.from_user.id, save_note=True)
+        if fast_reply:
+            await status_msg.edit_text(fast_reply)
+            return
 
         # Generate context-aware response using agent with tools
         deps = JournalDeps(
-            vector_store=vector_store,
+            vector_store=get_vector_store(),
             user_id=update.message.from_user.id,
             current_date=datetime.now().strftime("%Y-%m-%d %A")
         )
         prompt = f"User just said (via voice): \"{text}\". Please save this appropriately and provide a brief response."
 
         await status_msg.edit_text(get_random_feedback())
-        response = await llm_client.agent.run(prompt, deps=deps)
-
-        reply = get_result_data(response)
-        await status_msg.edit_text(reply)
-        
-        if os.path.exists(audio_path):
-            os.remove(audio_path)
+        # This prompt always asks for a save plus a reply, which streaming would cut short
+        await reply_with_agent(status_msg, prompt, deps, query=text, stream=False)
+        if completed:
+            await update.message.reply_text(format_completed(completed))
     except Exception as e:
         await update.message.reply_text(f"Error: {str(e)}")
 
@@ -106,8 +124,11 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     query = update.message.text
 
-    # Check if message mentions any reminders and auto-complete them
-    await check_and_complete_reminders(query, update.message.from_user.id)
+    # Reminders, completions, task lists and plain notes skip the agent
+    fast_reply, completed = await route_message(query, update.message.from_user.id)
+    if fast_reply:
+        await update.message.reply_text(fast_reply)
+        return
 
     # Send quick feedback
     await update.message.reply_chat_action("typing")
@@ -115,16 +136,111 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Let the agent handle the query
     deps = JournalDeps(
-        vector_store=vector_store,
+        vector_store=get_vector_store(),
         user_id=update.message.from_user.id,
         current_date=datetime.now().strftime("%Y-%m-%d %A")
     )
 
     try:
-        result = await llm_client.agent.run(query, deps=deps)
-        await feedback.edit_text(get_result_data(result))
+        await reply_with_agent(feedback, query, deps)
     except Exception as e:
         await feedback.edit_text(f"Sorry, ran into an issue: {str(e)}")
+    if completed:
+        await update.message.reply_text(format_completed(completed))
+
+async def reply_with_agent(status_msg, prompt: str, deps: JournalDeps, query: str = None, stream: bool = STREAM_RESPONSES):
+    """Run the agent and put its reply into status_msg, streaming it in when enabled"""
+    started = time.perf_counter()
+    if not stream:
+        reply = await llm_client.run_agent(prompt, deps, query=query)
+        intent_router.record_agent_run(time.perf_counter() - started)
+        await status_msg.edit_text(reply)
+        return
+
+    editor = StreamEditor(status_msg)
+    deps.progress = editor.status
+    try:
+        reply = await llm_client.run_agent(prompt, deps, on_text=editor.update, query=query)
+        await editor.finish(reply)
+    finally:
+        # On failure the caller edits in an error; a late partial frame must not overwrite it
+        await editor.cancel()
+
+    elapsed = time.perf_counter() - started
+    intent_router.record_agent_run(elapsed)
+    if editor.first_text_at is not None:
+        logger.info(
+            f"Streamed reply: first text after {editor.first_text_at - started:.2f}s, "
+            f"complete after {elapsed:.2f}s, {editor.edits} edits"
+        )
+
+def format_completed(completed: list) -> str:
+    return "Checked off: " + ", ".join(completed)
+
+async def route_message(text: str, user_id: int, save_note: bool = False):
+    """Answer clear-cut messages locally.
+
+    Returns (reply or None to run the agent, descriptions of reminders the
+    message completed); the caller tells the user about those either way.
+    With save_note, completions are recorded but the agent still runs to save the note.
+    """
+    started = time.perf_counter()
+    intent = await intent_router.classify(text)
+    store = get_vector_store()
+
+    # An explicit "done with X" may name a reminder loosely; any other message must
+    # mention all of a reminder's words. Setting a reminder or asking about one
+    # ("when is my dentist appointment?") completes nothing.
+    completed = []
+    if intent is not None and intent.name == "completion":
+        completed = await check_and_complete_reminders(text, user_id, partial=True)
+    elif (intent is None or intent.name != "reminder") and not is_question(text):
+        completed = await check_and_complete_reminders(text, user_id)
+
+    if intent is None:
+        return None, completed
+
+    if intent.name == "reminder":
+        what = intent.slots["what"]
+        try:
+            due_date, rule = await create_reminder(store, user_id, what, intent.slots["when"])
+        except (ValueError, OverflowError) as e:
+            # e.g. "at 25": the agent can ask what was meant
+            logger.info(f"Fast-path reminder time not understood ({e}), using the agent")
+            return None, completed
+        if rule:
+            reply = f"Got it, I'll remind you to {what} {describe_recurrence(rule)}, starting {due_date.strftime('%A, %B %d at %I:%M %p')}."
+        else:
+            reply = f"Got it, I'll remind you to {what} on {due_date.strftime('%A, %B %d at %I:%M %p')}."
+    elif intent.name == "completion":
+        if not completed or save_note:
+            # Nothing matched an open reminder: let the agent make sense of it
+            return None, completed
+        reply = "Nice, checked off: " + ", ".join(completed)
+        completed = []
+    elif intent.name == "list_reminders":
+        reminders = await store.get_tasks(user_id, status="open", task_type="reminder")
+        reply = format_reminders(reminders) if reminders else "No active reminders."
+    elif intent.name == "list_tasks":
+        tasks = await store.get_tasks(user_id, status="open")
+        reply = format_tasks(tasks) if tasks else "No open tasks."
+    elif intent.name == "journal_save":
+        # Local tags only: the fast path never calls the LLM
+        tags = (await llm_client.categorizer.categorize(intent.slots["text"])).categories
+        await store.add_entry(
+            text=intent.slots["text"],
+            categories=tags or ["general"],
+            user_id=user_id,
+            metadata={"type": "general"}
+        )
+        reply = "Saved to your journal."
+    else:
+        return None, completed
+
+    if completed:
+        reply += "\n\n" + format_completed(completed)
+    intent_router.record_fast_path(intent, time.perf_counter() - started)
+    return reply, completed
 
 async def handle_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle /start command"""
@@ -142,7 +258,7 @@ Commands:
 
 async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user statistics"""
-    recent = vector_store.get_recent_entries(update.message.from_user.id, limit=100)
+    recent = await get_vector_store().get_recent_entries(update.message.from_user.id, limit=100)
     
     category_counts = {}
     for entry in recent:
@@ -159,7 +275,7 @@ async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def handle_recent(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show recent entries"""
-    recent = vector_store.get_recent_entries(update.message.from_user.id, limit=5)
+    recent = await get_vector_store().get_recent_entries(update.message.from_user.id, limit=5)
     
     if not recent:
         await update.message.reply_text("No entries yet. Start journaling!")
@@ -181,12 +297,15 @@ async def handle_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await show_settings_menu(update)
 
 async def show_settings_menu(update: Update):
-    llm_provider = get_setting("llm_provider")
-    temp = get_setting("temperature")
-    tokens = get_setting("max_tokens")
+    user_id = update.effective_user.id
+    llm_provider = get_setting(user_id, "llm_provider")
+    temp = get_setting(user_id, "temperature")
+    tokens = get_setting(user_id, "max_tokens")
+    retrieval = get_setting(user_id, "retrieval_mode")
     
     text = f"Settings\n\n"
     text += f"LLM Provider: {llm_provider.upper()}\n"
+    text += f"Retrieval: {retrieval}\n"
     text += f"Temperature: {temp}\n"
     text += f"Max Tokens: {tokens}\n\n"
     text += "Select a setting to edit:"
@@ -194,6 +313,7 @@ async def show_settings_menu(update: Update):
     keyboard = [
         [
             InlineKeyboardButton("Switch LLM Provider", callback_data="set_provider"),
+            InlineKeyboardButton("Switch Retrieval", callback_data="set_retrieval"),
         ],
         [
             InlineKeyboardButton("Adjust Temperature", callback_data="set_temp"),
@@ -215,12 +335,19 @@ async def show_settings_menu(update: Update):
 async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle settings callbacks"""
     query = update.callback_query
+    user_id = query.from_user.id
     await query.answer()
     
     if query.data == "set_provider":
-        current = get_setting("llm_provider")
+        current = get_setting(user_id, "llm_provider")
         new = "openai" if current == "deepseek" else "deepseek"
-        update_setting("llm_provider", new)
+        update_setting(user_id, "llm_provider", new)
+        await show_settings_menu(update)
+
+    elif query.data == "set_retrieval":
+        current = get_setting(user_id, "retrieval_mode")
+        new = "prefetch" if current == "tools" else "tools"
+        update_setting(user_id, "retrieval_mode", new)
         await show_settings_menu(update)
         
     elif query.data == "set_temp":
@@ -234,7 +361,7 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     elif query.data.startswith("temp_"):
         temp = float(query.data.split("_")[1])
-        update_setting("temperature", temp)
+        update_setting(user_id, "temperature", temp)
         await show_settings_menu(update)
         
     elif query.data == "set_tokens":
@@ -247,12 +374,12 @@ async def handle_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
     elif query.data.startswith("tokens_"):
         tokens = int(query.data.split("_")[1])
-        update_setting("max_tokens", tokens)
+        update_setting(user_id, "max_tokens", tokens)
         await show_settings_menu(update)
         
     elif query.data == "set_prompt":
         context.user_data["awaiting_prompt"] = True
-        await query.edit_message_text("Send the new System Prompt. Current is:\n\n" + get_setting("system_prompt"))
+        await query.edit_message_text("Send the new System Prompt. Current is:\n\n" + get_setting(user_id, "system_prompt"))
         
     elif query.data == "back_to_settings":
         await show_settings_menu(update)
@@ -264,7 +391,10 @@ async def handle_prompt_update(update: Update, context: ContextTypes.DEFAULT_TYP
     """Handle text message when awaiting a new prompt"""
     if context.user_data.get("awaiting_prompt"):
         new_prompt = update.message.text
-        update_setting("system_prompt", new_prompt)
+        user_id = update.message.from_user.id
+        update_setting(user_id, "system_prompt", new_prompt)
+        # Replayed history carries the old prompt, which pydantic-ai would keep sending
+        llm_client.conversations.clear(user_id)
         context.user_data["awaiting_prompt"] = False
         await update.message.reply_text("System Prompt updated!")
         await show_settings_menu(update)
@@ -275,18 +405,20 @@ async def handle_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List all active reminders"""
     user_id = update.message.from_user.id
 
-    # Get all open tasks that are reminders
-    all_tasks = vector_store.get_tasks(user_id, status="open")
-    reminders = [t for t in all_tasks if t.payload.get('metadata', {}).get('type') == 'reminder']
+    # Reminder metadata is merged into the task payload, so "type" is top-level
+    reminders = await get_vector_store().get_tasks(user_id, status="open", task_type="reminder")
 
     if not reminders:
         await update.message.reply_text("No active reminders.")
         return
 
-    # Sort by due date
+    await update.message.reply_text(format_reminders(reminders))
+
+def format_reminders(reminders) -> str:
+    """Reminder list sorted by due date"""
     reminders_sorted = sorted(
         reminders,
-        key=lambda t: t.payload.get('due_date', '9999-12-31')
+        key=lambda t: t.payload.get('due_date') or '9999-12-31'
     )
 
     message = "📅 Your Reminders:\n\n"
@@ -305,35 +437,26 @@ async def handle_reminders(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             date_display = "No date"
 
-        message += f"• {description}\n  ⏰ {date_display}\n\n"
-
-    await update.message.reply_text(message)
-
-async def check_and_complete_reminders(message_text: str, user_id: int):
-    """Check if message mentions any reminders and mark them as completed"""
-    # Get all open reminders for this user
-    all_tasks = vector_store.get_tasks(user_id, status="open")
-    reminders = [t for t in all_tasks if t.payload.get('metadata', {}).get('type') == 'reminder']
-
-    message_lower = message_text.lower()
-
-    for reminder in reminders:
-        payload = reminder.payload
-        description = payload.get('description', '').lower()
-
-        # Simple matching: if the reminder text appears in the message
-        # Extract key words from reminder (remove common words)
-        reminder_words = set(description.split()) - {'the', 'a', 'an', 'to', 'for', 'on', 'in', 'at'}
-
-        # Check if significant words from reminder appear in message
-        matches = sum(1 for word in reminder_words if word in message_lower)
-
-        # If at least 50% of reminder words are mentioned, mark as done
-        if len(reminder_words) > 0 and matches / len(reminder_words) >= 0.5:
-            # Mark reminder as completed
-            vector_store.upsert_task(
-                user_id=user_id,
-                task_id=reminder.id,
-                description=description,
-                status="completed"
-            )
+        repeats = f" ({describe_recurrence(payload['recurrence'])})" if payload.get('recurrence') else ""
+        message += f"• {description}\n  ⏰ {date_display}{repeats}\n\n"
+
+    return message
+
+def format_tasks(tasks) -> str:
+    """Open task list, with due dates where set"""
+    message = "Your open tasks:\n\n"
+    for task in tasks:
+        payload = task.payload
+        due = f" (due {payload['due_date'][:10]})" if payload.get('due_date') else ""
+        message += f"• {payload.get('description', 'No description')}{due}\n"
+    return message
+
+async def check_and_complete_reminders(message_text: str, user_id: int, partial: bool = False):
+    """Check if message mentions any reminders, mark them as completed and return their descriptions"""
+    matched = await reminder_index.match(user_id, message_text, partial=partial)
+    if not matched:
+        return []
+
+    # One payload-only write for all of them; the index drops them via its task listener
+    await get_vector_store().update_task_fields([task_id for task_id, _ in matched], status="completed")
+    return [description for _, description in matched]
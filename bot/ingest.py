@@ -0,0 +1,150 @@
+import argparse
+import asyncio
+import json
+import logging
+import re
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# One FastEmbed batch / Qdrant upsert worth of entries
+INGEST_BATCH_SIZE = 64
+# Larger batches for historical imports, where throughput matters more than latency
+BULK_IMPORT_BATCH_SIZE = 256
+# How long add_entry waits for other writes to share its batch
+INGEST_MAX_DELAY_SECONDS = 0.005
+
+
+class IngestQueue:
+    """Write-behind queue that groups entries arriving close together into one write.
+
+    write(texts, payloads, ids) is awaited once per batch; each submit() resolves
+    when the batch containing its entry has been stored.
+    """
+
+    def __init__(self, write, max_batch: int = INGEST_BATCH_SIZE, max_delay: float = INGEST_MAX_DELAY_SECONDS):
+        self._write = write
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._pending = []
+        self._timer = None
+
+    async def submit(self, text: str, payload: dict, point_id: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, payload, point_id, future))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush_now)
+
+        return await future
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._flush(batch))
+
+    async def _flush(self, batch: list):
+        texts, payloads, ids, futures = zip(*batch)
+        try:
+            await self._write(list(texts), list(payloads), list(ids))
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for point_id, future in zip(ids, futures):
+            if not future.done():
+                future.set_result(point_id)
+
+
+# --- Historical journal import ---
+
+_DATE_HEADING = re.compile(r"^#{1,6}\s+(\d{4}-\d{2}-\d{2}(?:[ T]\d{2}:\d{2}(?::\d{2})?)?)\s*$")
+
+
+def load_json_entries(path: str, user_id: int):
+    """Entries from a JSON list of objects with "text" (or "content") and optional
+    "timestamp"/"date", "categories" and "type" fields"""
+    with open(path, "r") as f:
+        records = json.load(f)
+    for record in records:
+        text = (record.get("text") or record.get("content") or "").strip()
+        if not text:
+            continue
+        entry = {"text": text, "user_id": user_id}
+        timestamp = record.get("timestamp") or record.get("date")
+        if timestamp:
+            entry["timestamp"] = datetime.fromisoformat(timestamp).isoformat()
+        if record.get("categories"):
+            entry["categories"] = record["categories"]
+        entry["metadata"] = {"type": record.get("type", "general")}
+        yield entry
+
+
+def load_markdown_entries(path: str, user_id: int):
+    """Entries from a Markdown export: each "## YYYY-MM-DD" heading starts a dated
+    entry; without headings every paragraph becomes an undated entry"""
+    timestamp = None
+    lines = []
+
+    def flush():
+        text = "\n".join(lines).strip()
+        if text:
+            entry = {"text": text, "user_id": user_id, "metadata": {"type": "general"}}
+            if timestamp:
+                entry["timestamp"] = timestamp
+            return entry
+        return None
+
+    with open(path, "r") as f:
+        for raw in f:
+            line = raw.rstrip("\n")
+            heading = _DATE_HEADING.match(line)
+            if heading or (timestamp is None and not line.strip()):
+                entry = flush()
+                if entry:
+                    yield entry
+                lines = []
+                if heading:
+                    timestamp = datetime.fromisoformat(heading.group(1)).isoformat()
+                continue
+            lines.append(line)
+    entry = flush()
+    if entry:
+        yield entry
+
+
+async def import_file(path: str, user_id: int) -> int:
+    from .vector_store import get_vector_store
+
+    loader = load_markdown_entries if path.endswith((".md", ".markdown")) else load_json_entries
+    store = get_vector_store()
+    await store.ensure_schema()
+
+    start = time.perf_counter()
+    count = await store.bulk_import(loader(path, user_id))
+    elapsed = time.perf_counter() - start
+    logger.info(f"Imported {count} entries from {path} in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.0f}/s)")
+    await store.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import a JSON or Markdown journal export")
+    parser.add_argument("path")
+    parser.add_argument("--user-id", type=int, required=True, help="Telegram user id that owns the entries")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(import_file(args.path, args.user_id))
+
+
+if __name__ == '__main__':
+    main()
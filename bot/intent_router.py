@@ -0,0 +1,166 @@
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_WEEKDAY = r"(?:mon|tues?|wed(?:nes)?|thu(?:rs?)?|fri|sat(?:ur)?|sun)(?:day)?"
+_CLOCK = r"at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm)?"
+# The phrases parse_when understands (including recurrences), optionally followed by a clock time.
+# Bare weekdays need "on"/"next" or a clock time, so "the saturday game" isn't a date;
+# likewise "daily"/"weekly"/"monthly" only count at the end or next to a clock time ("the daily report").
+_WHEN = re.compile(
+    rf"\b(?:(?:today|tomorrow)(?:\s+{_CLOCK})?"
+    rf"|in\s+\d+\s+(?:minute|hour|day|week)s?"
+    rf"|(?:on|next)\s+{_WEEKDAY}(?:\s+{_CLOCK})?|{_WEEKDAY}\s+{_CLOCK}"
+    rf"|next\s+(?:week|month)(?:\s+{_CLOCK})?"
+    rf"|(?:every\s+(?:(?:other|[1-9]\d*)\s+)?(?:minute|hour|day|week|month)s?|every\s+(?:weekday|weekend)s?"
+    rf"|every\s+{_WEEKDAY})(?:\s+{_CLOCK})?"
+    rf"|(?:daily|weekly|monthly)(?:\s+{_CLOCK}|\s*$)|{_CLOCK}\s+(?:daily|weekly|monthly)\b"
+    rf"|{_CLOCK})\b",
+    re.IGNORECASE
+)
+# Date words parse_when would read but _WHEN alone doesn't: if any are left in the
+# reminder text, the phrase is split ("at 3pm tomorrow") and goes to the agent
+_DATE_WORD = re.compile(rf"\b(?:{_WEEKDAY}|today|tonight|tomorrow|noon|midnight|morning|evening)\b", re.IGNORECASE)
+_REMINDER = re.compile(r"^(?:(?:please|hey|can you|could you)\s+)*remind me\s+(?P<rest>.+)$", re.IGNORECASE)
+_COMPLETION = re.compile(
+    r"^(?:i(?:'m|\s+am)?\s+|just\s+)*(?:done with|finished|completed|did)\s+(?P<what>.+)$|^(?P<what2>.+?)\s+(?:is\s+)?done$",
+    re.IGNORECASE
+)
+_LIST_TASKS = re.compile(
+    r"^(?:show|list|what are|what's|whats|get)\s+(?:me\s+)?(?:all\s+)?(?:my\s+)?(?:open\s+)?"
+    r"(?P<kind>tasks|todos?|to-dos?|reminders)(?:\s+please)?$",
+    re.IGNORECASE
+)
+_QUESTION = re.compile(r"^(?:what|when|where|who|why|how|which|is|are|do|does|did|can|could|should|will)\b", re.IGNORECASE)
+_JOURNAL = re.compile(r"^(?:journal|note|log|diary)\s*:\s*(?P<text>.+)$", re.IGNORECASE | re.DOTALL)
+
+# Slot-free intents the embedding stage may pick for phrasings the rules miss
+EXEMPLARS = {
+    "list_tasks": [
+        "show my tasks", "what do I still have to do", "what's on my to-do list",
+        "what tasks are open", "anything left on my plate",
+    ],
+    "list_reminders": [
+        "show my reminders", "what reminders do I have", "what did you remind me about",
+        "any upcoming reminders",
+    ],
+}
+EMBEDDING_THRESHOLD = 0.88
+# A completion the fast path answers is just "done with <thing>"; anything longer
+# ("finished the report today, feeling relieved...") is a journal entry for the agent
+MAX_COMPLETION_WORDS = 6
+# Longer messages are real journal entries or questions: leave them to the agent
+MAX_EMBEDDING_WORDS = 8
+
+
+def is_question(text: str) -> bool:
+    """Asking about something ("what time is my dentist appointment?") isn't doing it"""
+    text = text.strip()
+    return text.endswith("?") or bool(_QUESTION.match(text))
+
+
+@dataclass
+class Intent:
+    name: str
+    slots: dict = field(default_factory=dict)
+    source: str = "rule"
+
+
+class IntentRouter:
+    """Local rule-plus-embedding classifier that picks out messages we can answer without the LLM"""
+
+    def __init__(self, get_embedder=None):
+        # Resolved on first use so the shared store is only created when needed
+        self._get_embedder = get_embedder
+        self._centroids = None
+        self.routed = 0
+        self.fallthrough = 0
+        self.fast_seconds = 0.0
+        # Running average of agent turns, to estimate what each fast path saved
+        self.agent_seconds_avg = None
+
+    def match_rules(self, text: str) -> Optional[Intent]:
+        text = text.strip().rstrip(".!?")
+
+        match = _JOURNAL.match(text)
+        if match:
+            return Intent("journal_save", {"text": match.group("text").strip()})
+
+        match = _LIST_TASKS.match(text)
+        if match:
+            kind = "list_reminders" if match.group("kind").lower() == "reminders" else "list_tasks"
+            return Intent(kind)
+
+        match = _REMINDER.match(text)
+        if match:
+            rest = match.group("rest")
+            when = _WHEN.search(rest)
+            if not when:
+                return None
+            what = re.sub(r"\s+", " ", rest[:when.start()] + " " + rest[when.end():]).strip(" ,")
+            what = re.sub(r"^(?:to|about)\s+|\s+to$", "", what, flags=re.IGNORECASE).strip(" ,")
+            if not what or _WHEN.search(what) or _DATE_WORD.search(what):
+                return None
+            return Intent("reminder", {"what": what, "when": when.group(0)})
+
+        match = _COMPLETION.match(text)
+        if match:
+            what = (match.group("what") or match.group("what2")).strip()
+            if len(what.split()) <= MAX_COMPLETION_WORDS and not re.search(r"[,;:\n]", what):
+                return Intent("completion", {"what": what})
+
+        return None
+
+    async def _match_embedding(self, text: str) -> Optional[Intent]:
+        if self._get_embedder is None or len(text.split()) > MAX_EMBEDDING_WORDS:
+            return None
+        embedder = self._get_embedder()
+        if self._centroids is None:
+            centroids = {}
+            for name, examples in EXEMPLARS.items():
+                vectors = np.array([await embedder.embed_query(e) for e in examples])
+                centroid = vectors.mean(axis=0)
+                centroids[name] = centroid / np.linalg.norm(centroid)
+            self._centroids = centroids
+
+        vector = np.array(await embedder.embed_query(text))
+        vector /= np.linalg.norm(vector)
+        name, score = max(((n, float(c @ vector)) for n, c in self._centroids.items()), key=lambda x: x[1])
+        if score >= EMBEDDING_THRESHOLD:
+            return Intent(name, source=f"embedding:{score:.2f}")
+        return None
+
+    async def classify(self, text: str) -> Optional[Intent]:
+        """Return a fast-path intent, or None to hand the message to the agent"""
+        return self.match_rules(text) or await self._match_embedding(text)
+
+    def record_fast_path(self, intent: Intent, seconds: float):
+        self.routed += 1
+        self.fast_seconds += seconds
+        saved = (self.agent_seconds_avg or 0.0) - seconds
+        logger.info(
+            f"Fast path {intent.name} ({intent.source}) in {seconds * 1000:.0f}ms, "
+            f"~{max(saved, 0):.1f}s saved; {self.stats()}"
+        )
+
+    def record_agent_run(self, seconds: float):
+        self.fallthrough += 1
+        if self.agent_seconds_avg is None:
+            self.agent_seconds_avg = seconds
+        else:
+            self.agent_seconds_avg = 0.9 * self.agent_seconds_avg + 0.1 * seconds
+
+    def stats(self) -> dict:
+        total = self.routed + self.fallthrough
+        avg_fast = self.fast_seconds / self.routed if self.routed else 0.0
+        return {
+            "hit_rate": round(self.routed / total, 3) if total else 0.0,
+            "routed": self.routed,
+            "agent_runs": self.fallthrough,
+            "avg_fast_ms": round(avg_fast * 1000, 1),
+            "est_seconds_saved": round(max((self.agent_seconds_avg or 0.0) - avg_fast, 0) * self.routed, 1),
+        }
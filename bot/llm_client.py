@@ -1,78 +1,165 @@
-from typing import List, Optional, Literal
+from typing import Awaitable, Callable, List, Optional, Literal
 from pydantic import BaseModel, Field
 from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import ModelResponse
 from pydantic_ai.models.openai import OpenAIModel
+from pydantic_ai.settings import ModelSettings
+from collections import OrderedDict
 from dataclasses import dataclass, field
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
-import asyncio
-from functools import partial
-from openai import OpenAI
-from .config import DEEPSEEK_API_KEY, OPENAI_API_KEY, get_setting, CATEGORIES
-from .vector_store import VectorStore
+import hashlib
+import logging
+import time
+from .config import get_setting, CATEGORIES
+from .vector_store import AsyncVectorStore, get_vector_store
+from .categorizer import Categorizer, LOW_CONFIDENCE
+from .transcription import Transcriber, create_transcriber
+from .conversation import ConversationCache
+from .retrieval import prefetch_context, format_entry, format_task
+from .providers import get_model
+from .date_parser import describe_recurrence
+from .reminder_index import tokenize
+
+logger = logging.getLogger(__name__)
 
 @dataclass
 class JournalDeps:
-    vector_store: VectorStore
+    vector_store: AsyncVectorStore
     user_id: int
     current_date: str = field(default_factory=lambda: datetime.now().strftime("%Y-%m-%d %A"))
+    # Called with short status lines ("Searching your journal…") while tools run
+    progress: Optional[Callable[[str], Awaitable[None]]] = None
+    # Journal lines retrieved in earlier turns, so follow-ups needn't search again
+    recent_snippets: List[str] = field(default_factory=list)
+    # Set in "prefetch" retrieval mode: journal and task context gathered before the run
+    retrieved_context: Optional[str] = None
+
+    async def report(self, status: str):
+        if self.progress is not None:
+            await self.progress(status)
 
 class ClassificationOutput(BaseModel):
     categories: List[str] = Field(description="List of categories that apply to the text")
     reasoning: str = Field(description="Brief explanation of why these categories were chosen")
 
+# Agents kept per (provider, system prompt, model settings); each edit adds a key, so bound it
+AGENT_CACHE_SIZE = 8
+
 class LLMClient:
     def __init__(self):
-        self._agent: Optional[Agent] = None
-        self._classifier: Optional[Agent] = None
-        self._last_provider: Optional[str] = None
-        self.openai_client = OpenAI(api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-
-    def _get_model(self):
-        """Get the appropriate model based on provider setting"""
-        provider = get_setting("llm_provider")
-
-        if provider == "deepseek":
-            # DeepSeek uses OpenAI-compatible API
-            return OpenAIModel(
-                "deepseek-chat",
-                base_url="https://api.deepseek.com",
-                api_key=DEEPSEEK_API_KEY
-            )
-        else:
-            # OpenAI
-            return "openai:gpt-4o-mini"
+        self._agents = OrderedDict()
+        self._classifiers = {}
+        self._transcriber: Optional[Transcriber] = None
+        self.categorizer = Categorizer(get_embedder=lambda: get_vector_store().embedder)
+        self.conversations = ConversationCache()
+
+    def _get_model(self, provider: str) -> OpenAIModel:
+        """Model for the provider, on the provider's shared connection pool"""
+        return get_model(provider)
 
-    def _get_agent(self) -> Agent:
-        provider = get_setting("llm_provider")
-        if self._agent is None or provider != self._last_provider:
-            self._last_provider = provider
-            model = self._get_model()
+    def _model_settings(self, user_id: int) -> ModelSettings:
+        """The user's /settings temperature and reply length, as sent to the model"""
+        return ModelSettings(
+            temperature=float(get_setting(user_id, "temperature")),
+            max_tokens=int(get_setting(user_id, "max_tokens"))
+        )
 
-            self._agent = Agent(
-                model,
+    def _get_agent(self, user_id: int) -> Agent:
+        provider = get_setting(user_id, "llm_provider")
+        system_prompt = get_setting(user_id, "system_prompt")
+        model_settings = self._model_settings(user_id)
+        prompt_hash = hashlib.sha1(system_prompt.encode()).hexdigest()
+        key = (provider, prompt_hash, tuple(sorted(model_settings.items())))
+        agent = self._agents.get(key)
+        if agent is None:
+            agent = Agent(
+                self._get_model(provider),
                 deps_type=JournalDeps,
-                system_prompt=get_setting("system_prompt"),
+                system_prompt=system_prompt,
+                model_settings=model_settings,
                 retries=2
             )
-            self._register_tools(self._agent)
-        return self._agent
-
-    def _get_classifier(self) -> Agent:
-        provider = get_setting("llm_provider")
-        if self._classifier is None or provider != self._last_provider:
-            model = self._get_model()
-            self._classifier = Agent(
-                model,
-                output_type=ClassificationOutput,
+            self._register_tools(agent)
+            self._agents[key] = agent
+            if len(self._agents) > AGENT_CACHE_SIZE:
+                self._agents.popitem(last=False)
+        else:
+            self._agents.move_to_end(key)
+        return agent
+
+    def _get_classifier(self, user_id: int) -> Agent:
+        provider = get_setting(user_id, "llm_provider")
+        classifier = self._classifiers.get(provider)
+        if classifier is None:
+            classifier = Agent(
+                self._get_model(provider),
+                result_type=ClassificationOutput,
                 system_prompt="You are an expert classifier. Categorize the journal entry accurately.",
                 retries=2
             )
-        return self._classifier
+            self._classifiers[provider] = classifier
+        return classifier
+
+    async def categorize(self, text: str, user_id: int) -> List[str]:
+        """Tag text with CATEGORIES locally; ask the LLM classifier only when unsure"""
+        result = await self.categorizer.categorize(text)
+        if result.confidence >= LOW_CONFIDENCE:
+            return result.categories
+
+        allowed = ", ".join(CATEGORIES)
+        try:
+            response = await self._get_classifier(user_id).run(
+                f"Categories: {allowed}\n\nJournal entry: {text}"
+            )
+        except Exception:
+            return result.categories
+        categories = [c for c in response.data.categories if c in CATEGORIES]
+        return categories or result.categories
+
+    async def run_agent(
+        self,
+        prompt: str,
+        deps: JournalDeps,
+        on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+        query: Optional[str] = None
+    ) -> str:
+        """Run the agent and return its reply.
 
-    @property
-    def agent(self) -> Agent:
-        return self._get_agent()
+        With on_text, the reply is streamed: on_text gets the full text so far as
+        tokens arrive. pydantic-ai treats a streamed response as final as soon as it
+        starts with text, so tool calls in that same response are not run.
+        In "prefetch" retrieval mode, context for `query` (default: the prompt) is
+        looked up first and put in the system prompt, saving tool round trips.
+        """
+        started = time.perf_counter()
+        agent = self._get_agent(deps.user_id)
+        mode = get_setting(deps.user_id, "retrieval_mode")
+        if mode == "prefetch":
+            deps.retrieved_context = await prefetch_context(deps.vector_store, deps.user_id, query or prompt)
+        retrieved_at = time.perf_counter()
+
+        history = self.conversations.history(deps.user_id)
+        deps.recent_snippets = self.conversations.snippets(deps.user_id)
+        if on_text is None:
+            result = await agent.run(prompt, message_history=history, deps=deps)
+            text = result.data
+        else:
+            text = None
+            async with agent.run_stream(prompt, message_history=history, deps=deps) as result:
+                async for text in result.stream_text(debounce_by=0.1):
+                    await on_text(text)
+                if text is None:
+                    text = await result.get_data()
+
+        new_messages = result.new_messages()
+        self.conversations.append(deps.user_id, new_messages)
+        model_calls = sum(1 for m in new_messages if isinstance(m, ModelResponse))
+        logger.info(
+            f"Agent run ({mode}): {model_calls} model calls, retrieval {(retrieved_at - started) * 1000:.0f}ms, "
+            f"total {time.perf_counter() - started:.2f}s"
+        )
+        return text
 
     def _register_tools(self, agent: Agent):
         @agent.tool
@@ -85,8 +172,21 @@ class LLMClient:
             due_date: Optional[str] = None
         ) -> str:
             """Create or update an actionable task."""
+            await ctx.deps.report("Updating your tasks…")
+            store = ctx.deps.vector_store
+            existing = await store.get_task(task_id) if task_id else None
+            if existing and existing.payload.get("description") == description:
+                # Same text, so the embedding is still valid: only touch the changed fields
+                fields = {"status": status}
+                if goal_id is not None:
+                    fields["goal_id"] = goal_id
+                if due_date is not None:
+                    fields["due_date"] = due_date
+                await store.update_task_fields([task_id], **fields)
+                return f"Task '{description}' updated."
+
             tid = task_id or str(uuid.uuid4())
-            ctx.deps.vector_store.upsert_task(
+            await store.upsert_task(
                 user_id=ctx.deps.user_id,
                 task_id=tid,
                 description=description,
@@ -97,19 +197,14 @@ class LLMClient:
             return f"Task '{description}' { 'updated' if task_id else 'created' }."
 
         @agent.tool
-        def get_open_tasks(ctx: RunContext[JournalDeps], goal_id: Optional[str] = None) -> str:
+        async def get_open_tasks(ctx: RunContext[JournalDeps], goal_id: Optional[str] = None) -> str:
             """Retrieve all currently open tasks for the user."""
-            tasks = ctx.deps.vector_store.get_tasks(ctx.deps.user_id, status="open", goal_id=goal_id)
+            await ctx.deps.report("Checking your tasks…")
+            tasks = await ctx.deps.vector_store.get_tasks(ctx.deps.user_id, status="open", goal_id=goal_id)
             if not tasks:
                 return "No open tasks found."
             
-            output = "Current Open Tasks:\n"
-            for t in tasks:
-                p = t.payload
-                due = f" [Due: {p['due_date']}]" if p.get('due_date') else ""
-                goal = f" (Goal: {p['goal_id']})" if p.get('goal_id') else ""
-                output += f"- {p['description']}{due}{goal}\n"
-            return output
+            return "Current Open Tasks:\n" + "".join(format_task(t) + "\n" for t in tasks)
 
         @agent.tool
         async def set_reminder(ctx: RunContext[JournalDeps], reminder_text: str, when: str = "tomorrow") -> str:
@@ -117,32 +212,48 @@ class LLMClient:
             - With time: 'today at 3pm', 'tomorrow at 12', 'Tuesday at 18:30'
             - Relative: 'in 2 hours', 'in 30 minutes', 'in 3 days'
             - Date only: 'tomorrow', 'Tuesday', 'next week'
+            - Recurring: 'every day at 8am', 'every monday at 9am', 'every weekday at 7:30'
             """
-            from .reminder_scheduler import parse_natural_date
+            from .reminder_scheduler import create_reminder
+            await ctx.deps.report("Setting a reminder…")
 
             try:
-                target_date = parse_natural_date(when)
-                due_date = target_date.isoformat()
-
-                tid = str(uuid.uuid4())
-                ctx.deps.vector_store.upsert_task(
-                    user_id=ctx.deps.user_id,
-                    task_id=tid,
-                    description=f"{reminder_text}",
-                    status="open",
-                    due_date=due_date,
-                    metadata={"type": "reminder"}
-                )
+                target_date, rule = await create_reminder(ctx.deps.vector_store, ctx.deps.user_id, reminder_text, when)
 
                 date_str = target_date.strftime("%A, %B %d")
+                if rule:
+                    return f"Recurring reminder set: '{reminder_text}' {describe_recurrence(rule)}, first on {date_str}"
                 return f"Reminder set: '{reminder_text}' on {date_str}"
             except Exception as e:
                 return f"Could not set reminder: {str(e)}"
 
-        @agent.system_prompt
+        @agent.tool
+        async def cancel_reminder(ctx: RunContext[JournalDeps], reminder_text: str) -> str:
+            """Stop an open reminder, including recurring ones ('stop reminding me to work out')."""
+            await ctx.deps.report("Updating your reminders…")
+            wanted = tokenize(reminder_text)
+            reminders = await ctx.deps.vector_store.get_tasks(ctx.deps.user_id, status="open", task_type="reminder")
+            matches = [
+                r for r in reminders
+                if wanted and len(wanted & tokenize(r.payload.get("description", ""))) / len(wanted) >= 0.5
+            ]
+            if not matches:
+                return "No matching open reminder found."
+            await ctx.deps.vector_store.update_task_fields([r.id for r in matches], status="archived")
+            return "Stopped: " + ", ".join(r.payload.get("description", "") for r in matches)
+
+        # Dynamic so the date and remembered snippets are refreshed when history is replayed
+        @agent.system_prompt(dynamic=True)
         def get_system_prompt(ctx: RunContext[JournalDeps]) -> str:
-            base_prompt = get_setting("system_prompt")
+            base_prompt = get_setting(ctx.deps.user_id, "system_prompt")
             date_info = f"\nToday is {ctx.deps.current_date}."
+            if ctx.deps.retrieved_context:
+                date_info += (
+                    "\nContext from the user's journal, already looked up for this message "
+                    "(only call the lookup tools if it doesn't cover the question):\n" + ctx.deps.retrieved_context
+                )
+            if ctx.deps.recent_snippets:
+                date_info += "\nJournal entries you already looked up in this conversation:\n" + "\n".join(ctx.deps.recent_snippets)
             instructions = """
 You are a down-to-earth coach, mentor, and friend. Talk like you're texting a friend. 
 Be chill, personal, and supportive. Use "I" and "you" naturally.
@@ -159,20 +270,26 @@ Keep it real. Don't sound like an AI.
             return f"{base_prompt}{date_info}{instructions}"
 
         @agent.tool
-        def search_journal(ctx: RunContext[JournalDeps], query: str, limit: int = 5) -> str:
+        async def search_journal(ctx: RunContext[JournalDeps], query: str, limit: int = 5) -> str:
             """Search the user's journal for relevant entries based on a query."""
-            results = ctx.deps.vector_store.search(query, ctx.deps.user_id, limit=limit)
+            await ctx.deps.report("Searching your journal…")
+            results = await ctx.deps.vector_store.search(query, ctx.deps.user_id, limit=limit)
             if not results:
                 return "No relevant entries found."
-            return "\n".join([f"- [{r.payload.get('type', 'general')}] {r.payload['text']} ({r.payload['timestamp'][:10]})" for r in results])
+            lines = [format_entry(r) for r in results]
+            self.conversations.add_snippets(ctx.deps.user_id, lines)
+            return "\n".join(lines)
 
         @agent.tool
-        def get_recent_entries(ctx: RunContext[JournalDeps], limit: int = 5) -> str:
+        async def get_recent_entries(ctx: RunContext[JournalDeps], limit: int = 5) -> str:
             """Retrieve the most recent entries from the user's journal."""
-            results = ctx.deps.vector_store.get_recent_entries(ctx.deps.user_id, limit=limit)
+            await ctx.deps.report("Reading your recent entries…")
+            results = await ctx.deps.vector_store.get_recent_entries(ctx.deps.user_id, limit=limit)
             if not results:
                 return "No entries found yet."
-            return "\n".join([f"- [{r.payload.get('type', 'general')}] {r.payload['text']} ({r.payload['timestamp'][:10]})" for r in results])
+            lines = [format_entry(r) for r in results]
+            self.conversations.add_snippets(ctx.deps.user_id, lines)
+            return "\n".join(lines)
 
         @agent.tool
         async def add_journal_entry(
@@ -183,14 +300,17 @@ Keep it real. Don't sound like an AI.
             metadata: Optional[dict] = None
         ) -> str:
             """Add a new entry to the journal."""
+            await ctx.deps.report("Saving to your journal…")
             final_metadata = metadata or {}
             final_metadata["type"] = entry_type
             if status:
                 final_metadata["status"] = status
             
-            categories = [entry_type] if entry_type != "general" else ["general"]
-            
-            ctx.deps.vector_store.add_entry(
+            # Entry type plus CATEGORIES tags, so search(categories=...) can filter on either
+            tags = await self.categorize(text, ctx.deps.user_id)
+            categories = list(dict.fromkeys(([entry_type] if entry_type != "general" else []) + tags)) or ["general"]
+
+            await ctx.deps.vector_store.add_entry(
                 text=text,
                 categories=categories,
                 user_id=ctx.deps.user_id,
@@ -205,8 +325,9 @@ Keep it real. Don't sound like an AI.
             new_status: Literal["pending", "in_progress", "completed", "abandoned"]
         ) -> str:
             """Update the status of an existing goal."""
+            await ctx.deps.report("Updating your goal…")
             text = f"Updated status for goal '{goal_description}' to {new_status}."
-            ctx.deps.vector_store.add_entry(
+            await ctx.deps.vector_store.add_entry(
                 text=text,
                 categories=["goal", "update"],
                 user_id=ctx.deps.user_id,
@@ -214,18 +335,8 @@ Keep it real. Don't sound like an AI.
             )
             return f"Goal status updated to {new_status}."
 
-    async def transcribe(self, audio_file_path: str) -> str:
-        """Transcribe audio using OpenAI Whisper API"""
-        if not self.openai_client:
-            raise ValueError("OpenAI API key not configured for transcription")
-        
-        def _call_openai():
-            with open(audio_file_path, "rb") as audio_file:
-                return self.openai_client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file
-                )
-        
-        loop = asyncio.get_event_loop()
-        transcript = await loop.run_in_executor(None, _call_openai)
-        return transcript.text
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg") -> str:
+        """Transcribe in-memory audio with the configured backend (OpenAI or local Whisper)"""
+        if self._transcriber is None:
+            self._transcriber = create_transcriber()
+        return await self._transcriber.transcribe(audio, filename)
@@ -1,7 +1,8 @@
 import logging
 import os
+import time
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
-from .config import TELEGRAM_TOKEN
+from .config import TELEGRAM_TOKEN, get_settings_store
 from .handlers import (
     handle_voice,
     handle_text,
@@ -11,9 +12,14 @@ from .handlers import (
     handle_settings,
     handle_callback,
     handle_prompt_update,
-    handle_reminders
+    handle_reminders,
+    llm_client,
+    reminder_index
 )
 from .reminder_scheduler import ReminderScheduler
+from .vector_store import get_vector_store
+from .embeddings import peak_rss_mb
+from .providers import close_clients
 
 # Configure logging to both console and file
 os.makedirs("logs", exist_ok=True)
@@ -41,12 +47,34 @@ async def message_handler(update, context):
     # Otherwise handle as normal text query
     await handle_text(update, context)
 
-def main():
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+async def post_init(app):
+    """Set up collections, load the embedding model and start reminders before the first update arrives"""
+    start = time.perf_counter()
+    store = get_vector_store()
+    await store.ensure_schema()
+    await store.embedder.warmup()
+    llm_client.conversations.load()
+    await reminder_index.ensure_loaded()
+
+    scheduler = ReminderScheduler(app.bot, store)
+    await scheduler.start()
+    app.bot_data["reminder_scheduler"] = scheduler
+    logger.info(f"Startup finished in {time.perf_counter() - start:.2f}s (peak RSS {peak_rss_mb():.0f} MB)")
 
-    # Initialize reminder scheduler
-    scheduler = ReminderScheduler(app.bot)
-    scheduler.start()
+async def post_shutdown(app):
+    scheduler = app.bot_data.get("reminder_scheduler")
+    if scheduler:
+        scheduler.stop()
+    await get_settings_store().close()
+    llm_client.conversations.save()
+    logger.info(f"Conversations: {llm_client.conversations.stats()}")
+    store = get_vector_store()
+    logger.info(f"Embedding cache: {store.embedder.cache.stats()}")
+    await store.close()
+    await close_clients()
+
+def main():
+    app = Application.builder().token(TELEGRAM_TOKEN).post_init(post_init).post_shutdown(post_shutdown).build()
 
     # Register error handler
     app.add_error_handler(error_handler)
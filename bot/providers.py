@@ -0,0 +1,76 @@
+import logging
+import httpx
+from openai import AsyncOpenAI
+from pydantic_ai.models.openai import OpenAIModel
+from .config import (
+    DEEPSEEK_API_KEY,
+    OPENAI_API_KEY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_KEEPALIVE_SECONDS,
+    LLM_TIMEOUT_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+# OpenAI-compatible endpoints the bot can talk to
+PROVIDERS = {
+    "deepseek": {"base_url": "https://api.deepseek.com", "api_key": DEEPSEEK_API_KEY, "model": "deepseek-chat"},
+    "openai": {"base_url": None, "api_key": OPENAI_API_KEY, "model": "gpt-4o-mini"},
+}
+
+try:
+    import h2  # noqa: F401
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+# One pooled client per provider, shared by agents, the classifier and transcription
+_clients = {}
+_models = {}
+
+
+def get_client(provider: str) -> AsyncOpenAI:
+    """Pooled keep-alive (HTTP/2 when h2 is installed) client for a provider"""
+    client = _clients.get(provider)
+    if client is None:
+        if provider not in PROVIDERS:
+            raise ValueError(f"Unknown LLM provider '{provider}', expected one of {list(PROVIDERS)}")
+        config = PROVIDERS[provider]
+        if not config["api_key"]:
+            raise ValueError(f"API key not configured for {provider}")
+        timeout = httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0)
+        http_client = httpx.AsyncClient(
+            http2=HTTP2,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_SECONDS
+            )
+        )
+        client = AsyncOpenAI(
+            base_url=config["base_url"],
+            api_key=config["api_key"],
+            http_client=http_client,
+            timeout=timeout,
+            max_retries=2
+        )
+        _clients[provider] = client
+        logger.info(f"HTTP client for {provider}: http2={HTTP2}, {HTTP_MAX_CONNECTIONS} connections")
+    return client
+
+
+def get_model(provider: str) -> OpenAIModel:
+    """Chat model for a provider, built once on top of its shared client"""
+    model = _models.get(provider)
+    if model is None:
+        model = OpenAIModel(PROVIDERS[provider]["model"], openai_client=get_client(provider))
+        _models[provider] = model
+    return model
+
+
+async def close_clients():
+    for client in _clients.values():
+        await client.close()
+    _clients.clear()
+    _models.clear()
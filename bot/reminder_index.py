@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import re
+from collections import defaultdict
+from typing import List, Tuple
+import numpy as np
+from .config import REMINDER_MATCH_CONFIRM
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = frozenset({
+    "the", "a", "an", "to", "for", "on", "in", "at", "of", "and", "or", "my", "me",
+    "i", "is", "it", "with", "about", "up", "remind", "reminder",
+})
+# Share of a reminder's words an explicit "done with ..." must mention to complete it;
+# any other message must mention all of them
+MATCH_RATIO = 0.5
+# With confirmation on, partial matches also need this message/reminder similarity
+CONFIRM_SIMILARITY = 0.6
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so "called" and "calls" still match "call" """
+    for suffix in ("ing", "ed", "es", "s"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> set:
+    return {_stem(w) for w in _TOKEN.findall(text.lower()) if w not in STOPWORDS}
+
+
+class ReminderIndex:
+    """In-memory inverted index of open reminders: token -> task ids, per user.
+
+    Loaded once from the store, then kept current by the store's task-write
+    listener, so matching a message is one tokenize pass plus dict lookups.
+    """
+
+    def __init__(self, get_store, confirm: bool = REMINDER_MATCH_CONFIRM):
+        self._get_store = get_store
+        self.confirm = confirm
+        self._postings = defaultdict(lambda: defaultdict(set))
+        self._reminders = {}
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            store = self._get_store()
+            # Listen first so writes made while loading aren't missed
+            store.add_task_listener(self.on_task_written)
+            async for task in store.iter_tasks(status="open", task_type="reminder"):
+                self._add(str(task.id), task.payload)
+            self._loaded = True
+            logger.info(f"Reminder index loaded: {len(self._reminders)} open reminders")
+
+    def _add(self, task_id: str, payload: dict):
+        self._remove(task_id)
+        user_id = payload.get("user_id")
+        description = payload.get("description", "")
+        tokens = tokenize(description)
+        # Mentioning a recurring reminder doesn't end the series; only cancel_reminder does
+        if user_id is None or not tokens or payload.get("recurrence"):
+            return
+        self._reminders[task_id] = (user_id, tokens, description)
+        postings = self._postings[user_id]
+        for token in tokens:
+            postings[token].add(task_id)
+
+    def _remove(self, task_id: str):
+        entry = self._reminders.pop(task_id, None)
+        if entry is None:
+            return
+        user_id, tokens, _ = entry
+        postings = self._postings[user_id]
+        for token in tokens:
+            postings[token].discard(task_id)
+            if not postings[token]:
+                del postings[token]
+
+    def on_task_written(self, task_id, payload: dict):
+        task_id = str(task_id)
+        if payload.get("status", "open") != "open":
+            self._remove(task_id)
+        elif payload.get("type") == "reminder" and "description" in payload:
+            self._add(task_id, payload)
+        # Other partial updates (due date, goal) don't change what a reminder matches
+
+    async def match(self, user_id: int, text: str, partial: bool = False) -> List[Tuple[str, str]]:
+        """Open reminders the message mentions, as (task_id, description) pairs.
+
+        Only reminders whose every word appears count, unless partial is set (the
+        message is an explicit completion); partial matches are then confirmed by
+        embedding similarity when confirmation is on.
+        """
+        await self.ensure_loaded()
+        postings = self._postings.get(user_id)
+        if not postings:
+            return []
+
+        hits = defaultdict(int)
+        for token in tokenize(text):
+            for task_id in postings.get(token, ()):
+                hits[task_id] += 1
+
+        matched = []
+        candidates = []
+        for task_id, count in hits.items():
+            _, tokens, description = self._reminders[task_id]
+            ratio = count / len(tokens)
+            if ratio >= 1.0 or (partial and ratio >= MATCH_RATIO and not self.confirm):
+                matched.append((task_id, description))
+            elif partial and ratio >= MATCH_RATIO:
+                candidates.append((task_id, description))
+
+        if candidates:
+            matched.extend(await self._confirm(text, candidates))
+        return matched
+
+    async def _confirm(self, text: str, candidates: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Keep partial matches whose description is semantically close to the message"""
+        embedder = self._get_store().embedder
+        message = np.array(await embedder.embed_query(text))
+        reminders = np.array(await embedder.embed_passages([d for _, d in candidates]))
+        scores = reminders @ message / (np.linalg.norm(reminders, axis=1) * np.linalg.norm(message))
+        return [c for c, score in zip(candidates, scores) if score >= CONFIRM_SIMILARITY]
+
+    def stats(self) -> dict:
+        return {"reminders": len(self._reminders), "users": len(self._postings)}
@@ -1,219 +1,251 @@
+import asyncio
+import heapq
 import logging
-from datetime import datetime, timedelta
-from dateutil import parser as dateparser
-from dateutil.relativedelta import relativedelta
+import uuid
+from datetime import datetime
+from typing import Optional, Tuple
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from telegram import Bot
-from .vector_store import VectorStore
-from .config import TELEGRAM_TOKEN
+from telegram.error import Forbidden, BadRequest, RetryAfter, TelegramError
+from .vector_store import AsyncVectorStore, get_vector_store
+# Re-exported: callers have always imported the parser from here
+from .date_parser import parse_natural_date, parse_when, next_occurrence
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on one sleep, so wall-clock jumps and missed wakeups self-correct
+MAX_SLEEP_SECONDS = 300
+
+# Telegram allows ~30 messages/second overall and ~1 message/second per chat
+GLOBAL_SENDS_PER_SECOND = 25
+PER_CHAT_INTERVAL_SECONDS = 1.0
+MAX_CONCURRENT_SENDS = 20
+MAX_SEND_ATTEMPTS = 4
+
+
+class RateLimiter:
+    """Spaces out acquire() calls to at most `rate` per second"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def idle(self) -> bool:
+        """True when the next acquire() wouldn't wait, so the limiter can be dropped"""
+        return self._next_slot <= asyncio.get_running_loop().time()
+
+
 class ReminderScheduler:
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, vector_store: AsyncVectorStore = None):
         self.bot = bot
-        self.vector_store = VectorStore()
+        self.vector_store = vector_store or get_vector_store()
         self.scheduler = AsyncIOScheduler()
-
-    def start(self):
-        """Start the reminder scheduler"""
-        # Check for due reminders every 15 minutes
-        self.scheduler.add_job(
-            self.check_and_send_reminders,
-            'interval',
-            minutes=15,
-            id='reminder_check'
-        )
+        # Min-heap of (due datetime, task_id) for open reminders. Entries can go stale
+        # (completed or rescheduled); they only cause a cheap extra due-query.
+        self._heap = []
+        self._wakeup = asyncio.Event()
+        self._runner = None
+
+        self._send_slots = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+        self._global_limiter = RateLimiter(GLOBAL_SENDS_PER_SECOND)
+        self._chat_limiters = {}
+
+    async def start(self):
+        """Load upcoming reminders and start waiting for the next one"""
+        await self.reload()
+        self.vector_store.add_task_listener(self._on_task_written)
+        self._runner = asyncio.create_task(self._run())
+
+        # Hourly resync picks up tasks written outside this process
+        self.scheduler.add_job(self.reload, 'interval', hours=1, id='reminder_resync')
         self.scheduler.start()
-        logger.info("Reminder scheduler started - checking every 15 minutes")
+        logger.info(f"Reminder scheduler started - {len(self._heap)} upcoming reminders")
+
+    async def reload(self):
+        """Rebuild the heap from all open tasks that have a due date"""
+        heap = []
+        async for task in self.vector_store.iter_tasks(status="open"):
+            due_date = _parse_due_date(task.payload.get('due_date'))
+            if due_date:
+                heap.append((due_date, str(task.id)))
+        heapq.heapify(heap)
+        self._heap = heap
+        self._wakeup.set()
+
+    def _on_task_written(self, task_id, payload: dict):
+        """Track reminders as soon as set_reminder/upsert_task writes them"""
+        # Partial updates without a status may still touch an open task's due date
+        if payload.get('status', "open") != "open":
+            return
+        due_date = _parse_due_date(payload.get('due_date'))
+        if not due_date:
+            return
+        heapq.heappush(self._heap, (due_date, str(task_id)))
+        # Only a new earliest reminder changes how long we sleep
+        if self._heap[0][1] == str(task_id):
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                await self._run_once()
+            except Exception as e:
+                # Keep the loop alive; a bad entry must not stop every later reminder
+                logger.exception(f"Reminder loop error: {e}")
+                await asyncio.sleep(1)
+
+    async def _run_once(self):
+        """Send what is due, or sleep until the next reminder or a wakeup"""
+        self._wakeup.clear()
+        now = datetime.now()
+
+        if self._heap and self._heap[0][0] <= now:
+            while self._heap and self._heap[0][0] <= now:
+                heapq.heappop(self._heap)
+            await self.check_and_send_reminders()
+            return
+
+        timeout = MAX_SLEEP_SECONDS
+        if self._heap:
+            timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
 
     async def check_and_send_reminders(self):
-        """Check for due reminders and send notifications"""
+        """Send all due reminders concurrently, then mark the delivered ones completed"""
         logger.info("Checking for due reminders...")
 
-        # Get all open tasks (including reminders)
         try:
-            all_tasks = self.vector_store.get_all_tasks(status="open")
-
+            # Only open tasks whose due date has passed; the range filter runs in Qdrant
+            due_tasks = [
+                task async for task in self.vector_store.iter_tasks(status="open", due_before=datetime.now())
+            ]
+            if not due_tasks:
+                return
+
+            delivered = await asyncio.gather(*(self._deliver(task) for task in due_tasks))
+            sent = [task for task, ok in zip(due_tasks, delivered) if ok]
+            # One limiter per chat would otherwise pile up for every user ever reminded
+            self._chat_limiters = {
+                user_id: limiter for user_id, limiter in self._chat_limiters.items() if not limiter.idle()
+            }
+
+            # One-off reminders are done; recurring ones move on to their next occurrence
             now = datetime.now()
-            for task in all_tasks:
-                payload = task.payload
-                due_date_str = payload.get('due_date')
-
-                if not due_date_str:
-                    continue
-
+            completed_ids = []
+            next_due = {}
+            for task in sent:
+                rule = task.payload.get('recurrence')
+                due_date = _parse_due_date(task.payload.get('due_date'))
                 try:
-                    due_date = datetime.fromisoformat(due_date_str)
-
-                    # If reminder is due (current time has passed the due time)
-                    if due_date <= now:
-                        user_id = payload.get('user_id')
-                        description = payload.get('description', '')
-                        task_id = task.id
-
-                        # Send notification to user
-                        message = f"⏰ Reminder: {description}"
-
-                        try:
-                            await self.bot.send_message(
-                                chat_id=user_id,
-                                text=message
-                            )
-                            logger.info(f"Sent reminder to user {user_id}: {description}")
-
-                            # Mark reminder as completed after sending
-                            self.vector_store.upsert_task(
-                                user_id=user_id,
-                                task_id=task_id,
-                                description=description,
-                                status="completed"
-                            )
-                        except Exception as e:
-                            logger.error(f"Failed to send reminder to user {user_id}: {e}")
-
-                except Exception as e:
-                    logger.error(f"Error processing reminder: {e}")
-
+                    # Occurrences missed while the bot was down are skipped, not replayed
+                    if rule and due_date:
+                        next_due[task.id] = next_occurrence(rule, due_date, max(due_date, now)).isoformat()
+                        continue
+                except ValueError as e:
+                    logger.warning(f"Ending recurring reminder {task.id}: {e}")
+                completed_ids.append(task.id)
+
+            # One payload-only write per kind for the whole batch
+            await self.vector_store.update_task_fields(completed_ids, status="completed")
+            await self.vector_store.set_task_due_dates(next_due)
+            logger.info(
+                f"Delivered {len(sent)}/{len(due_tasks)} due reminders "
+                f"({len(next_due)} recurring rescheduled)"
+            )
         except Exception as e:
             logger.error(f"Error checking reminders: {e}")
 
+    async def _deliver(self, task) -> bool:
+        """Send one reminder within the global and per-chat rate limits, retrying on flood control"""
+        payload = task.payload
+        user_id = payload.get('user_id')
+        description = payload.get('description', '')
+        message = f"⏰ Reminder: {description}"
+
+        chat_limiter = self._chat_limiters.get(user_id)
+        if chat_limiter is None:
+            chat_limiter = self._chat_limiters[user_id] = RateLimiter(1 / PER_CHAT_INTERVAL_SECONDS)
+
+        for attempt in range(MAX_SEND_ATTEMPTS):
+            # Wait for the chat's turn before taking one of the shared send slots
+            await chat_limiter.acquire()
+            async with self._send_slots:
+                await self._global_limiter.acquire()
+                try:
+                    await self.bot.send_message(chat_id=user_id, text=message)
+                    logger.info(f"Sent reminder to user {user_id}: {description}")
+                    return True
+                except RetryAfter as e:
+                    logger.warning(f"Rate limited sending to {user_id}, retrying in {e.retry_after}s")
+                    retry_delay = e.retry_after
+                except (Forbidden, BadRequest) as e:
+                    # Blocked bot or unknown chat: retrying won't help
+                    logger.error(f"Failed to send reminder to user {user_id}: {e}")
+                    return False
+                except TelegramError as e:
+                    logger.warning(f"Send to {user_id} failed (attempt {attempt + 1}): {e}")
+                    retry_delay = 2 ** attempt
+            if attempt + 1 < MAX_SEND_ATTEMPTS:
+                await asyncio.sleep(retry_delay)
+
+        logger.error(f"Giving up on reminder for user {user_id} after {MAX_SEND_ATTEMPTS} attempts")
+        return False
+
     def stop(self):
         """Stop the scheduler"""
+        if self._runner:
+            self._runner.cancel()
         self.scheduler.shutdown()
         logger.info("Reminder scheduler stopped")
 
 
-def parse_natural_date(date_string: str) -> datetime:
-    """
-    Parse natural language dates and times like:
-    - 'today at 3pm', 'tomorrow at 12', 'Tuesday at 18:30'
-    - 'in 2 hours', 'in 30 minutes'
-    - 'next week', 'in 3 days'
-    Returns a datetime object
-    """
-    import re
-
-    date_string = date_string.lower().strip()
-    now = datetime.now()
-
-    # Extract time component if present (e.g., "at 3pm", "at 15:30", "at 12")
-    time_match = re.search(r'at\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?', date_string)
-    target_time = None
-
-    if time_match:
-        hour = int(time_match.group(1))
-        minute = int(time_match.group(2)) if time_match.group(2) else 0
-        am_pm = time_match.group(3)
+def _parse_due_date(due_date_str):
+    """Parse a stored due_date as naive server-local time, None when missing or malformed"""
+    if not due_date_str:
+        return None
+    try:
+        due_date = datetime.fromisoformat(due_date_str)
+    except (TypeError, ValueError):
+        return None
+    # The LLM can store offsets ("...Z"); the heap only holds naive local times
+    if due_date.tzinfo is not None:
+        due_date = due_date.astimezone().replace(tzinfo=None)
+    return due_date
 
-        # Handle AM/PM
-        if am_pm == 'pm' and hour < 12:
-            hour += 12
-        elif am_pm == 'am' and hour == 12:
-            hour = 0
 
-        target_time = (hour, minute)
-        # Remove time part from string for date parsing
-        date_string = re.sub(r'at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm)?', '', date_string).strip()
+async def create_reminder(vector_store: AsyncVectorStore, user_id: int, reminder_text: str, when: str) -> Tuple[datetime, Optional[str]]:
+    """Store a reminder task due at the parsed 'when'.
 
-    # Handle "in X minutes/hours"
-    if "in" in date_string:
-        parts = date_string.split()
-        try:
-            idx = parts.index("in")
-            if idx + 2 <= len(parts):
-                num = int(parts[idx + 1])
-                unit = parts[idx + 2].lower() if idx + 2 < len(parts) else ""
-
-                if "minute" in unit:
-                    return now + timedelta(minutes=num)
-                elif "hour" in unit:
-                    return now + timedelta(hours=num)
-                elif "day" in unit:
-                    result = now + timedelta(days=num)
-                    if target_time:
-                        result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-                    return result
-                elif "week" in unit:
-                    result = now + timedelta(weeks=num)
-                    if target_time:
-                        result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-                    return result
-        except (ValueError, IndexError):
-            pass
-
-    # Handle "tomorrow"
-    if "tomorrow" in date_string:
-        result = now + timedelta(days=1)
-        if target_time:
-            result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-        else:
-            result = result.replace(hour=9, minute=0, second=0, microsecond=0)  # Default 9 AM
-        return result
-
-    # Handle "today"
-    if "today" in date_string or date_string == "":
-        result = now
-        if target_time:
-            result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-            # If time has already passed today, schedule for tomorrow
-            if result <= now:
-                result = result + timedelta(days=1)
-        return result
-
-    # Handle day names (monday, tuesday, etc.)
-    days_of_week = {
-        'monday': 0, 'mon': 0,
-        'tuesday': 1, 'tue': 1, 'tues': 1,
-        'wednesday': 2, 'wed': 2,
-        'thursday': 3, 'thu': 3, 'thur': 3, 'thurs': 3,
-        'friday': 4, 'fri': 4,
-        'saturday': 5, 'sat': 5,
-        'sunday': 6, 'sun': 6
-    }
-
-    for day_name, day_num in days_of_week.items():
-        if day_name in date_string:
-            current_day = now.weekday()
-            days_ahead = day_num - current_day
-
-            # If the day is today or has passed this week, schedule for next week
-            if days_ahead <= 0:
-                days_ahead += 7
-
-            # If "next" is mentioned, add another week
-            if "next" in date_string:
-                days_ahead += 7
-
-            result = now + timedelta(days=days_ahead)
-            if target_time:
-                result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-            else:
-                result = result.replace(hour=9, minute=0, second=0, microsecond=0)  # Default 9 AM
-            return result
-
-    # Handle "next week" / "next month"
-    if "next week" in date_string:
-        result = now + timedelta(weeks=1)
-        if target_time:
-            result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-        return result
-
-    if "next month" in date_string:
-        result = now + relativedelta(months=1)
-        if target_time:
-            result = result.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-        return result
-
-    # Try using dateutil parser as fallback
-    try:
-        parsed = dateparser.parse(date_string, fuzzy=True)
-        if parsed and target_time:
-            parsed = parsed.replace(hour=target_time[0], minute=target_time[1], second=0, microsecond=0)
-        return parsed if parsed else now + timedelta(hours=1)
-    except:
-        # Default to 1 hour from now if parsing fails
-        return now + timedelta(hours=1)
+    Recurring phrases ("every monday at 9am") store one task with its rule in
+    "recurrence"; the scheduler advances due_date after each send. Returns
+    (first due datetime, RRULE body or None).
+    """
+    target_date, rule = parse_when(when)
+    metadata = {"type": "reminder"}
+    if rule:
+        metadata["recurrence"] = rule
+    await vector_store.upsert_task(
+        user_id=user_id,
+        task_id=str(uuid.uuid4()),
+        description=reminder_text,
+        status="open",
+        due_date=target_date.isoformat(),
+        metadata=metadata
+    )
+    return target_date, rule
 
 
 def calculate_days_until(target_date: datetime) -> int:
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+from .config import RETRIEVAL_TOKEN_BUDGET
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LIMIT = 8
+RECENT_LIMIT = 5
+# Below this cosine similarity a search hit is more noise than context
+MIN_SEARCH_SCORE = 0.5
+
+
+def format_entry(point) -> str:
+    """One journal entry as a prompt/tool line"""
+    payload = point.payload
+    return f"- [{payload.get('type', 'general')}] {payload['text']} ({payload['timestamp'][:10]})"
+
+
+def format_task(point) -> str:
+    payload = point.payload
+    due = f" [Due: {payload['due_date']}]" if payload.get('due_date') else ""
+    goal = f" (Goal: {payload['goal_id']})" if payload.get('goal_id') else ""
+    return f"- {payload.get('description', 'No description')}{due}{goal}"
+
+
+def _estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+async def prefetch_context(store, user_id: int, query: str, token_budget: int = RETRIEVAL_TOKEN_BUDGET) -> str:
+    """Run the lookups the agent would otherwise make as tool calls, all at once.
+
+    Returns prompt-ready context: relevant entries (by similarity), open tasks and
+    recent entries, deduplicated and cut off at token_budget.
+    """
+    hits, tasks, recent = await asyncio.gather(
+        store.search(query, user_id, limit=SEARCH_LIMIT),
+        store.get_tasks(user_id, status="open"),
+        store.get_recent_entries(user_id, limit=RECENT_LIMIT),
+    )
+
+    # Highest value first, so the budget cuts the least useful lines
+    sections = [
+        ("Relevant journal entries", [format_entry(p) for p in hits if p.score >= MIN_SEARCH_SCORE]),
+        ("Open tasks", [format_task(p) for p in sorted(tasks, key=lambda t: t.payload.get('due_date') or '9999-12-31')]),
+        ("Most recent entries", [format_entry(p) for p in recent]),
+    ]
+
+    seen = set()
+    used = 0
+    blocks = []
+    for title, lines in sections:
+        kept = []
+        for line in lines:
+            if line in seen:
+                continue
+            cost = _estimate_tokens(line)
+            if used + cost > token_budget:
+                break
+            seen.add(line)
+            used += cost
+            kept.append(line)
+        if kept:
+            blocks.append(f"{title}:\n" + "\n".join(kept))
+
+    if not blocks:
+        return "No journal entries or open tasks yet."
+    return "\n\n".join(blocks)
@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Row owner for settings that apply to every user without an override of their own
+GLOBAL_USER = 0
+# Writes arriving within this window share one transaction
+FLUSH_DELAY_SECONDS = 0.5
+
+
+class SettingsStore:
+    """Per-user settings: an in-memory cache in front of SQLite in WAL mode.
+
+    Lookups fall back from the user's own value to the global value to the
+    defaults, and never touch the disk. set() updates the cache immediately and
+    queues the row; queued rows are written together off the event loop.
+    """
+
+    def __init__(self, path: str, defaults: dict, legacy_json: str = None):
+        self.path = path
+        self.defaults = defaults
+        self._values = {}
+        self._dirty = {}
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+        self._db_lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS settings ("
+            "user_id INTEGER NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "PRIMARY KEY (user_id, key))"
+        )
+        self._db.commit()
+
+        for user_id, key, value in self._db.execute("SELECT user_id, key, value FROM settings"):
+            self._values.setdefault(user_id, {})[key] = json.loads(value)
+        if not self._values and legacy_json:
+            self._migrate(legacy_json)
+
+    def _migrate(self, legacy_json: str):
+        """Import the old global settings.json once, as the global values"""
+        if not os.path.exists(legacy_json):
+            return
+        try:
+            with open(legacy_json, "r") as f:
+                legacy = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not migrate {legacy_json}: {e}")
+            return
+        self._values[GLOBAL_USER] = dict(legacy)
+        self._write([(GLOBAL_USER, key, json.dumps(value)) for key, value in legacy.items()])
+        os.replace(legacy_json, legacy_json + ".migrated")
+        logger.info(f"Migrated {len(legacy)} settings from {legacy_json} to {self.path}")
+
+    def get(self, user_id: int, key: str):
+        own = self._values.get(user_id)
+        if own is not None and key in own:
+            return own[key]
+        shared = self._values.get(GLOBAL_USER)
+        if shared is not None and key in shared:
+            return shared[key]
+        return self.defaults.get(key)
+
+    def set(self, user_id: int, key: str, value):
+        self._values.setdefault(user_id, {})[key] = value
+        self._dirty[(user_id, key)] = json.dumps(value)
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts, CLI): write straight through
+            self._write(self._take_dirty())
+            return
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(FLUSH_DELAY_SECONDS, lambda: asyncio.ensure_future(self.flush()))
+
+    def _take_dirty(self) -> list:
+        rows = [(user_id, key, value) for (user_id, key), value in self._dirty.items()]
+        self._dirty = {}
+        return rows
+
+    def _write(self, rows: list):
+        if not rows:
+            return
+        with self._db_lock, self._db:
+            self._db.executemany(
+                "INSERT INTO settings (user_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, key) DO UPDATE SET value = excluded.value",
+                rows
+            )
+
+    async def flush(self):
+        """Write all queued changes in one transaction on a worker thread"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            rows = self._take_dirty()
+            if not rows:
+                return
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except sqlite3.Error as e:
+                logger.error(f"Settings flush failed, will retry: {e}")
+                # Keep newer values queued since the failed attempt
+                for user_id, key, value in rows:
+                    self._dirty.setdefault((user_id, key), value)
+
+    async def close(self):
+        await self.flush()
+        with self._db_lock:
+            self._db.close()
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import time
+from telegram.error import BadRequest, RetryAfter
+from .config import STREAM_EDIT_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Telegram's limit for a single message
+MAX_MESSAGE_LENGTH = 4096
+# Appended to partial text so the user can see the reply is still coming
+CURSOR = " ▍"
+
+
+class StreamEditor:
+    """Progressively edits one Telegram message as a reply streams in.
+
+    Edits are coalesced to at most one per `interval` seconds (Telegram throttles
+    frequent edits of the same message); only the newest text is ever sent, so a
+    slow edit never queues up stale ones behind it.
+    """
+
+    def __init__(self, message, interval: float = STREAM_EDIT_INTERVAL_SECONDS):
+        self.message = message
+        self.interval = interval
+        self._latest = None
+        self._shown = None
+        self._last_edit = 0.0
+        self._pending = None
+        self._lock = asyncio.Lock()
+        self._cancelled = False
+        self.first_text_at = None
+        self.edits = 0
+
+    async def status(self, text: str):
+        """Show a progress line such as "Searching journal…" until text arrives"""
+        if self.first_text_at is None:
+            self._schedule(text)
+
+    async def update(self, text: str):
+        """New partial reply text (the full text so far, not a delta)"""
+        if not text.strip():
+            return
+        if self.first_text_at is None:
+            self.first_text_at = time.perf_counter()
+        self._schedule(text.rstrip() + CURSOR)
+
+    async def finish(self, text: str):
+        """Show the final reply, then send whatever exceeds one message as follow-ups"""
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        chunks = [text[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(text), MAX_MESSAGE_LENGTH)] or [text]
+        self._latest = chunks[0]
+        await self._edit(final=True)
+        for chunk in chunks[1:]:
+            await self.message.reply_text(chunk)
+
+    async def cancel(self):
+        """Drop any queued edit and wait out one in flight, so none lands after
+        the caller writes its own text (e.g. an error) into the message"""
+        self._cancelled = True
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        async with self._lock:
+            pass
+
+    def _schedule(self, text: str):
+        if self._cancelled:
+            return
+        self._latest = text[:MAX_MESSAGE_LENGTH]
+        if self._pending is None:
+            delay = max(0.0, self._last_edit + self.interval - time.monotonic())
+            self._pending = asyncio.ensure_future(self._edit_after(delay))
+
+    async def _edit_after(self, delay: float):
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        self._pending = None
+        try:
+            await self._edit()
+        except Exception as e:
+            # Intermediate frames are best effort; finish() reports real failures
+            logger.warning(f"Progressive edit failed: {e}")
+
+    async def _edit(self, final: bool = False):
+        async with self._lock:
+            while True:
+                text = self._latest
+                if text is None or text == self._shown or (self._cancelled and not final):
+                    return
+                try:
+                    await self.message.edit_text(text)
+                except RetryAfter as e:
+                    logger.warning(f"Edit throttled by Telegram, backing off {e.retry_after}s")
+                    self._last_edit = time.monotonic() + float(e.retry_after)
+                    if not final:
+                        # Skip this frame: the next edit carries the newest text anyway
+                        return
+                    await asyncio.sleep(float(e.retry_after))
+                    continue
+                except BadRequest as e:
+                    if "not modified" not in str(e).lower():
+                        raise
+                self._shown = text
+                self._last_edit = time.monotonic()
+                self.edits += 1
+                return
@@ -0,0 +1,175 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .config import (
+    OPENAI_API_KEY,
+    TRANSCRIPTION_BACKEND,
+    TRANSCRIPTION_WORKERS,
+    TRANSCRIPTION_MAX_PENDING,
+    WHISPER_MODEL,
+)
+from .providers import get_client
+
+logger = logging.getLogger(__name__)
+
+# Long voice notes upload and transcribe slower than a chat completion
+TRANSCRIPTION_TIMEOUT_SECONDS = 120.0
+
+
+class TranscriptionBusy(Exception):
+    """Raised when the transcription queue is full"""
+
+
+class TranscriptionBackend:
+    """Turns audio bytes into text. Implementations run the work off the event loop."""
+
+    name = "base"
+
+    async def transcribe(self, audio: bytes, filename: str) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Hosted whisper-1 through the OpenAI API, on the shared async connection pool"""
+
+    name = "openai"
+
+    def __init__(self, workers: int):
+        if not OPENAI_API_KEY:
+            raise ValueError("OpenAI API key not configured for transcription")
+        # Concurrency is bounded by Transcriber; the requests themselves are plain async I/O
+        self.client = get_client("openai")
+
+    async def transcribe(self, audio: bytes, filename: str) -> str:
+        transcript = await self.client.audio.transcriptions.create(
+            model="whisper-1",
+            file=(filename, audio),
+            timeout=TRANSCRIPTION_TIMEOUT_SECONDS
+        )
+        return transcript.text
+
+
+# Loaded once per worker process by _init_local_worker
+_local_model = None
+
+def _init_local_worker(model_name: str):
+    global _local_model
+    from faster_whisper import WhisperModel
+    # One CPU thread per process: the pool itself provides the parallelism
+    _local_model = WhisperModel(model_name, device="cpu", compute_type="int8", cpu_threads=1)
+
+def _transcribe_local(audio: bytes) -> str:
+    segments, _ = _local_model.transcribe(io.BytesIO(audio), beam_size=1, vad_filter=True)
+    return " ".join(segment.text.strip() for segment in segments)
+
+
+class LocalWhisperBackend(TranscriptionBackend):
+    """Offline faster-whisper (int8, CPU) in a dedicated process pool.
+
+    Needs the optional faster-whisper package; each worker loads its own model.
+    """
+
+    name = "local"
+
+    def __init__(self, workers: int, model_name: str = WHISPER_MODEL):
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError:
+            raise ValueError("TRANSCRIPTION_BACKEND=local needs faster-whisper: pip install faster-whisper")
+        self.model_name = model_name
+        # spawn, not fork: workers must not inherit the parent's ONNX/Qdrant state
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_local_worker,
+            initargs=(model_name,)
+        )
+
+    async def transcribe(self, audio: bytes, filename: str) -> str:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, _transcribe_local, audio)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+BACKENDS = {
+    "openai": OpenAIWhisperBackend,
+    "local": LocalWhisperBackend,
+}
+
+
+class Transcriber:
+    """Bounded front door to a backend: at most `workers` jobs run and at most
+    `max_pending` are queued or running; beyond that it raises TranscriptionBusy"""
+
+    def __init__(self, backend: TranscriptionBackend, workers: int, max_pending: int):
+        self.backend = backend
+        self.max_pending = max_pending
+        self._slots = asyncio.Semaphore(workers)
+        self._pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    async def transcribe(self, audio: bytes, filename: str = "voice.ogg") -> str:
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise TranscriptionBusy(f"{self._pending} voice notes already waiting")
+
+        self._pending += 1
+        queued_at = time.perf_counter()
+        try:
+            async with self._slots:
+                started_at = time.perf_counter()
+                try:
+                    text = await self.backend.transcribe(audio, filename)
+                except Exception:
+                    self.failed += 1
+                    raise
+                finished_at = time.perf_counter()
+        finally:
+            self._pending -= 1
+
+        wait = started_at - queued_at
+        elapsed = finished_at - started_at
+        self.completed += 1
+        self.total_wait_seconds += wait
+        self.total_seconds += elapsed
+        logger.info(
+            f"Transcribed {len(audio) / 1024:.0f} KB via {self.backend.name} in {elapsed:.2f}s "
+            f"(queued {wait:.2f}s, {self._pending} in queue)"
+        )
+        return text
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "pending": self._pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+            "avg_wait_seconds": self.total_wait_seconds / self.completed if self.completed else 0.0,
+        }
+
+    def close(self):
+        self.backend.close()
+
+
+def create_transcriber() -> Transcriber:
+    """Build the transcriber selected by TRANSCRIPTION_BACKEND"""
+    backend_cls = BACKENDS.get(TRANSCRIPTION_BACKEND)
+    if backend_cls is None:
+        raise ValueError(f"Unknown TRANSCRIPTION_BACKEND '{TRANSCRIPTION_BACKEND}', expected one of {list(BACKENDS)}")
+    backend = backend_cls(TRANSCRIPTION_WORKERS)
+    logger.info(f"Transcription backend: {backend.name} ({TRANSCRIPTION_WORKERS} workers)")
+    return Transcriber(backend, TRANSCRIPTION_WORKERS, TRANSCRIPTION_MAX_PENDING)
@@ -1,58 +1,202 @@
-from qdrant_client import QdrantClient, models
+from qdrant_client import AsyncQdrantClient, models
 from qdrant_client.http.exceptions import UnexpectedResponse
+import heapq
+import logging
+import time
 import uuid
 from datetime import datetime
 from .config import QDRANT_HOST, QDRANT_PORT
+from .embeddings import Embedder, EMBEDDING_DIM, peak_rss_mb
+from .ingest import IngestQueue, BULK_IMPORT_BATCH_SIZE
 
-class VectorStore:
-    def __init__(self):
+logger = logging.getLogger(__name__)
+
+# Payload fields every query filters or orders on, per collection.
+# Reminder metadata is merged into the task payload, so "type" is a top-level key.
+PAYLOAD_INDEXES = {
+    "journal": {
+        "user_id": models.PayloadSchemaType.INTEGER,
+        "type": models.PayloadSchemaType.KEYWORD,
+        "categories": models.PayloadSchemaType.KEYWORD,
+        "timestamp": models.PayloadSchemaType.DATETIME,
+    },
+    "tasks": {
+        "user_id": models.PayloadSchemaType.INTEGER,
+        "status": models.PayloadSchemaType.KEYWORD,
+        "goal_id": models.PayloadSchemaType.KEYWORD,
+        "type": models.PayloadSchemaType.KEYWORD,
+        "due_date": models.PayloadSchemaType.DATETIME,
+    },
+}
+
+class AsyncVectorStore:
+    def __init__(self, embedder: Embedder = None):
+        # Embedded Qdrant (memory or on-disk path) has no payload indexes
+        self.local = True
         if QDRANT_HOST == ":memory:":
-            self.client = QdrantClient(":memory:")
+            self.client = AsyncQdrantClient(":memory:")
         else:
             # Check if QDRANT_HOST is a path (starts with . or / or \ or contains :)
             if QDRANT_HOST.startswith((".", "/", "\\")) or ":" in QDRANT_HOST[1:]:
-                self.client = QdrantClient(path=QDRANT_HOST)
+                self.client = AsyncQdrantClient(path=QDRANT_HOST)
             else:
-                self.client = QdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+                self.client = AsyncQdrantClient(host=QDRANT_HOST, port=QDRANT_PORT)
+                self.local = False
 
         self.collection_name = "journal"
         self.tasks_collection = "tasks"
 
-        # FastEmbed model
-        self.model_name = "BAAI/bge-small-en-v1.5" # 384 dim, fast and light
-        self.client.set_model(self.model_name)
+        # Embeddings run on the embedder's worker pool, not inside the client
+        self.embedder = embedder or Embedder()
+        # Same vector name QdrantClient.add used, so existing collections keep working
+        self.vector_name = "fast-" + self.embedder.model_name.split("/")[-1].lower()
+
+        # Collections known to exist; filled by ensure_schema() and dropped on errors
+        self._known_collections = set()
+
+        # Called with (task_id, payload) after every task write
+        self._task_listeners = []
+
+        # Coalesces concurrent add_entry calls into batched writes
+        self._ingest = IngestQueue(
+            lambda texts, payloads, ids: self._upsert_documents(self.collection_name, texts, payloads, ids)
+        )
+
+    async def ensure_schema(self):
+        """Create the journal and tasks collections and their payload indexes once at startup"""
+        for collection_name in (self.collection_name, self.tasks_collection):
+            await self._ensure_collection(collection_name)
+            if not self.local:
+                await self._ensure_payload_indexes(collection_name)
 
-    def _collection_exists(self, collection_name: str) -> bool:
-        """Check if a collection exists"""
+    async def _ensure_payload_indexes(self, collection_name: str):
+        """Create any declared payload index the collection is missing"""
+        info = await self.client.get_collection(collection_name)
+        existing = info.payload_schema or {}
+        for field_name, schema in PAYLOAD_INDEXES.get(collection_name, {}).items():
+            if field_name in existing:
+                continue
+            logger.info(f"Creating {schema.value} payload index on {collection_name}.{field_name}")
+            await self.client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=schema
+            )
+
+    async def _collection_exists(self, collection_name: str) -> bool:
+        """Check if a collection exists, served from the cache once it has been seen"""
+        if collection_name in self._known_collections:
+            return True
         try:
-            collections = self.client.get_collections().collections
-            return any(c.name == collection_name for c in collections)
+            exists = await self.client.collection_exists(collection_name)
         except Exception:
             return False
-        
-    def add_entry(self, text: str, categories: list, user_id: int, metadata: dict = None):
-        """Add journal entry to vector store using auto-embedding"""
+        if exists:
+            self._known_collections.add(collection_name)
+        return exists
+
+    def _invalidate(self, collection_name: str):
+        """Forget a cached collection after an error so the next call checks Qdrant again"""
+        self._known_collections.discard(collection_name)
+
+    async def _ensure_collection(self, collection_name: str):
+        """Create a collection with the embedding vector config if it is missing"""
+        if await self._collection_exists(collection_name):
+            return
+        await self.client.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                self.vector_name: models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE)
+            }
+        )
+        self._known_collections.add(collection_name)
+
+    def add_task_listener(self, callback):
+        """Register callback(task_id, payload) to run after each task write"""
+        self._task_listeners.append(callback)
+
+    def _notify_task_written(self, task_id, payload: dict):
+        for callback in self._task_listeners:
+            try:
+                callback(task_id, payload)
+            except Exception as e:
+                logger.error(f"Task listener failed for {task_id}: {e}")
+
+    async def _upsert_documents(self, collection_name: str, documents: list, payloads: list, ids: list, cache: bool = True):
+        """Embed documents off the event loop and write them in one upsert"""
+        vectors = await self.embedder.embed_passages(documents, cache=cache)
+        await self._ensure_collection(collection_name)
+        try:
+            await self.client.upsert(
+                collection_name=collection_name,
+                points=[
+                    models.PointStruct(id=point_id, vector={self.vector_name: vector.tolist()}, payload={"document": doc, **payload})
+                    for point_id, vector, doc, payload in zip(ids, vectors, documents, payloads)
+                ]
+            )
+        except UnexpectedResponse:
+            self._invalidate(collection_name)
+            raise
+
+    def _entry_payload(self, text: str, categories: list, user_id: int, metadata: dict = None, timestamp: str = None) -> dict:
         payload = {
             "text": text,
             "categories": categories,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": timestamp or datetime.now().isoformat(),
             "user_id": user_id
         }
         if metadata:
             payload.update(metadata)
-        
+        return payload
+
+    async def add_entry(self, text: str, categories: list, user_id: int, metadata: dict = None):
+        """Add journal entry to vector store.
+
+        Entries written within a few milliseconds of each other share one embedding
+        batch and one upsert; this returns once the entry is stored.
+        """
+        payload = self._entry_payload(text, categories, user_id, metadata)
         point_id = str(uuid.uuid4())
-        
-        self.client.add(
-            collection_name=self.collection_name,
-            documents=[text],
-            metadata=[payload],
-            ids=[point_id]
-        )
+
+        await self._ingest.submit(text, payload, point_id)
         return point_id
 
-    def upsert_task(self, user_id: int, task_id: str, description: str, status: str = "open", goal_id: str = None, due_date: str = None, metadata: dict = None):
-        """Add or update a task using auto-embedding"""
+    async def bulk_import(self, entries, batch_size: int = BULK_IMPORT_BATCH_SIZE) -> int:
+        """Import journal entries in embedding-sized batches, one upsert per batch.
+
+        entries is any iterable of dicts with "text" and "user_id", and optionally
+        "categories", "timestamp" (ISO string) and "metadata". Returns the number imported.
+        """
+        count = 0
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                count += await self._import_batch(batch)
+                batch = []
+        if batch:
+            count += await self._import_batch(batch)
+        return count
+
+    async def _import_batch(self, batch: list) -> int:
+        texts = [entry["text"] for entry in batch]
+        payloads = [
+            self._entry_payload(
+                entry["text"],
+                entry.get("categories") or ["general"],
+                entry["user_id"],
+                entry.get("metadata"),
+                entry.get("timestamp")
+            )
+            for entry in batch
+        ]
+        ids = [str(uuid.uuid4()) for _ in batch]
+        # Historical text is embedded once; keep it out of the embedding caches
+        await self._upsert_documents(self.collection_name, texts, payloads, ids, cache=False)
+        return len(batch)
+
+    async def upsert_task(self, user_id: int, task_id: str, description: str, status: str = "open", goal_id: str = None, due_date: str = None, metadata: dict = None):
+        """Add or update a task"""
         payload = {
             "description": description,
             "status": status,
@@ -63,19 +207,67 @@ class VectorStore:
         }
         if metadata:
             payload.update(metadata)
-            
-        self.client.add(
-            collection_name=self.tasks_collection,
-            documents=[description],
-            metadata=[payload],
-            ids=[task_id]
-        )
+
+        await self._upsert_documents(self.tasks_collection, [description], [payload], [task_id])
+        self._notify_task_written(task_id, payload)
         return task_id
 
-    def get_tasks(self, user_id: int, status: str = None, goal_id: str = None):
+    async def update_task_fields(self, task_ids: list, **fields):
+        """Set payload fields on tasks in one call, without re-embedding"""
+        if not task_ids:
+            return
+        payload = {**fields, "updated_at": datetime.now().isoformat()}
+        try:
+            await self.client.set_payload(
+                collection_name=self.tasks_collection,
+                payload=payload,
+                points=list(task_ids)
+            )
+        except UnexpectedResponse:
+            self._invalidate(self.tasks_collection)
+            raise
+        for task_id in task_ids:
+            self._notify_task_written(task_id, payload)
+
+    async def set_task_due_dates(self, due_dates: dict):
+        """Move tasks to new due dates ({task_id: iso string}) in one batched call"""
+        if not due_dates:
+            return
+        updated_at = datetime.now().isoformat()
+        payloads = {task_id: {"due_date": due_date, "updated_at": updated_at} for task_id, due_date in due_dates.items()}
+        try:
+            await self.client.batch_update_points(
+                collection_name=self.tasks_collection,
+                update_operations=[
+                    models.SetPayloadOperation(set_payload=models.SetPayload(payload=payload, points=[task_id]))
+                    for task_id, payload in payloads.items()
+                ]
+            )
+        except UnexpectedResponse:
+            self._invalidate(self.tasks_collection)
+            raise
+        for task_id, payload in payloads.items():
+            self._notify_task_written(task_id, payload)
+
+    async def get_task(self, task_id: str):
+        """Fetch a single task by id, or None"""
+        if not await self._collection_exists(self.tasks_collection):
+            return None
+        try:
+            points = await self.client.retrieve(
+                collection_name=self.tasks_collection,
+                ids=[task_id],
+                with_payload=True,
+                with_vectors=False
+            )
+        except (UnexpectedResponse, ValueError):
+            return None
+        return points[0] if points else None
+
+    async def get_tasks(self, user_id: int, status: str = None, goal_id: str = None, task_type: str = None):
         """Get tasks for a user with optional filters"""
         # Return empty list if collection doesn't exist yet
-        if not self._collection_exists(self.tasks_collection):
+        if not await self._collection_exists(self.tasks_collection):
             return []
 
         must_filters = [models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))]
@@ -83,45 +275,82 @@ class VectorStore:
             must_filters.append(models.FieldCondition(key="status", match=models.MatchValue(value=status)))
         if goal_id:
             must_filters.append(models.FieldCondition(key="goal_id", match=models.MatchValue(value=goal_id)))
+        if task_type:
+            must_filters.append(models.FieldCondition(key="type", match=models.MatchValue(value=task_type)))
 
+        # Page through everything: a single scroll stops at Qdrant's default of 10 points
+        tasks = []
+        offset = None
         try:
-            results = self.client.scroll(
-                collection_name=self.tasks_collection,
-                scroll_filter=models.Filter(must=must_filters),
-                with_payload=True,
-                with_vectors=False
-            )
-            return results[0]
+            while True:
+                points, offset = await self.client.scroll(
+                    collection_name=self.tasks_collection,
+                    scroll_filter=models.Filter(must=must_filters),
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                tasks.extend(points)
+                if offset is None:
+                    return tasks
         except UnexpectedResponse:
+            self._invalidate(self.tasks_collection)
             return []
 
-    def get_all_tasks(self, status: str = None):
-        """Get all tasks across all users with optional status filter (for scheduler)"""
-        # Return empty list if collection doesn't exist yet
-        if not self._collection_exists(self.tasks_collection):
-            return []
+    async def iter_tasks(
+        self,
+        status: str = None,
+        due_before: datetime = None,
+        due_after: datetime = None,
+        task_type: str = None,
+        page_size: int = 256
+    ):
+        """Stream tasks across all users page by page, with filters evaluated by Qdrant.
+
+        due_before/due_after are inclusive bounds on due_date; tasks without a due date
+        never match a due_date bound.
+        """
+        # Nothing to stream if collection doesn't exist yet
+        if not await self._collection_exists(self.tasks_collection):
+            return
 
         must_filters = []
         if status:
             must_filters.append(models.FieldCondition(key="status", match=models.MatchValue(value=status)))
+        if task_type:
+            must_filters.append(models.FieldCondition(key="type", match=models.MatchValue(value=task_type)))
+        if due_before or due_after:
+            must_filters.append(models.FieldCondition(key="due_date", range=models.DatetimeRange(lte=due_before, gte=due_after)))
+        scroll_filter = models.Filter(must=must_filters) if must_filters else None
 
-        try:
-            scroll_filter = models.Filter(must=must_filters) if must_filters else None
-            results = self.client.scroll(
-                collection_name=self.tasks_collection,
-                scroll_filter=scroll_filter,
-                with_payload=True,
-                with_vectors=False,
-                limit=1000  # Get up to 1000 tasks
-            )
-            return results[0]
-        except UnexpectedResponse:
-            return []
+        offset = None
+        while True:
+            try:
+                points, offset = await self.client.scroll(
+                    collection_name=self.tasks_collection,
+                    scroll_filter=scroll_filter,
+                    limit=page_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+            except UnexpectedResponse:
+                self._invalidate(self.tasks_collection)
+                return
+            for point in points:
+                yield point
+            if offset is None:
+                return
+
+    async def get_all_tasks(self, status: str = None):
+        """Get all tasks across all users with optional status filter"""
+        return [task async for task in self.iter_tasks(status=status)]
 
-    def search(self, query: str, user_id: int, categories: list = None, limit: int = 5):
-        """Search for relevant entries using auto-embedding"""
+    async def search(self, query: str, user_id: int, categories: list = None, limit: int = 5):
+        """Search for relevant entries"""
         # Return empty list if collection doesn't exist yet
-        if not self._collection_exists(self.collection_name):
+        if not await self._collection_exists(self.collection_name):
             return []
 
         must_filters = [
@@ -130,45 +359,84 @@ class VectorStore:
         if categories:
             must_filters.append(models.FieldCondition(key="categories", match=models.MatchAny(any=categories)))
 
+        query_vector = await self.embedder.embed_query(query)
         try:
-            results = self.client.query(
+            return await self.client.search(
                 collection_name=self.collection_name,
-                query_text=query,
+                query_vector=models.NamedVector(name=self.vector_name, vector=query_vector.tolist()),
                 query_filter=models.Filter(must=must_filters),
-                limit=limit
+                limit=limit,
+                with_payload=True
             )
-            
-            # The high-level client.query returns a list of QueryResponse objects
-            # but some versions might return a single QueryResponse with a .points attribute.
-            # We also ensure each item has a 'payload' attribute (some versions use 'metadata').
-            points = results.points if hasattr(results, "points") else results
-            
-            class NormalizedResult:
-                def __init__(self, res):
-                    self.id = getattr(res, "id", None)
-                    self.payload = getattr(res, "payload", getattr(res, "metadata", {}))
-                    self.score = getattr(res, "score", 0)
-            
-            return [NormalizedResult(p) for p in points]
         except UnexpectedResponse:
+            self._invalidate(self.collection_name)
             return []
-    
-    def get_recent_entries(self, user_id: int, limit: int = 10):
-        """Get recent entries for a user"""
+
+    async def get_recent_entries(self, user_id: int, limit: int = 10):
+        """Get the latest entries for a user, newest first"""
         # Return empty list if collection doesn't exist yet
-        if not self._collection_exists(self.collection_name):
+        if not await self._collection_exists(self.collection_name):
             return []
 
+        user_filter = models.Filter(
+            must=[models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))]
+        )
         try:
-            results = self.client.scroll(
+            # Ordered scroll over the timestamp index reads only the newest `limit` points
+            results = await self.client.scroll(
                 collection_name=self.collection_name,
-                scroll_filter=models.Filter(
-                    must=[models.FieldCondition(key="user_id", match=models.MatchValue(value=user_id))]
-                ),
+                scroll_filter=user_filter,
                 limit=limit,
+                order_by=models.OrderBy(key="timestamp", direction=models.Direction.DESC),
                 with_payload=True,
                 with_vectors=False
             )
-            return sorted(results[0], key=lambda x: x.payload["timestamp"], reverse=True)
+            return results[0]
+        except UnexpectedResponse as e:
+            # Servers without the timestamp index reject order_by; scan the user's entries instead
+            logger.warning(f"Ordered scroll failed, falling back to full scan: {e}")
+
+        try:
+            entries = []
+            offset = None
+            while True:
+                points, offset = await self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=user_filter,
+                    limit=256,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False
+                )
+                entries = heapq.nlargest(limit, entries + points, key=lambda x: x.payload["timestamp"])
+                if offset is None:
+                    return entries
         except UnexpectedResponse:
+            self._invalidate(self.collection_name)
             return []
+
+    async def close(self):
+        await self.client.close()
+        self.embedder.close()
+
+
+# Existing imports and type hints keep working
+VectorStore = AsyncVectorStore
+
+_vector_store: AsyncVectorStore = None
+
+def get_vector_store() -> AsyncVectorStore:
+    """Process-wide store shared by handlers, agent tools and the scheduler.
+
+    One Qdrant client and one embedding model per process: a second embedded
+    (path=...) client would also fight over the storage lock.
+    """
+    global _vector_store
+    if _vector_store is None:
+        start = time.perf_counter()
+        _vector_store = AsyncVectorStore()
+        logger.info(
+            f"Vector store ready in {(time.perf_counter() - start) * 1000:.0f}ms "
+            f"(peak RSS {peak_rss_mb():.0f} MB)"
+        )
+    return _vector_store
@@ -13,7 +13,7 @@ sudo apt update && sudo apt upgrade -y
 
 # 2. Install Python, pip, and system dependencies
 echo "🐍 Installing Python 3..."
-sudo apt install -y python3 python3-pip python3-venv unzip
+sudo apt install -y python3 python3-pip python3-venv unzip ffmpeg
 
 # 3. Install Node.js and PM2
 if ! command -v pm2 &> /dev/null; then
@@ -30,7 +30,7 @@ QDRANT_DATA_DIR="$HOME/qdrant_data"
 if ! command -v qdrant &> /dev/null; then
     echo "   Downloading Qdrant..."
     # Download latest linux binary
-    wget https://github.com/qdrant/qdrant/releases/download/v1.7.4/qdrant-x86_64-unknown-linux-gnu.tar.gz
+    wget https://github.com/qdrant/qdrant/releases/download/v1.12.4/qdrant-x86_64-unknown-linux-gnu.tar.gz
     tar -xzf qdrant-x86_64-unknown-linux-gnu.tar.gz
     sudo mv qdrant /usr/local/bin/
     rm qdrant-x86_64-unknown-linux-gnu.tar.gz